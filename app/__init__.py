@@ -1,13 +1,25 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 import os
 import logging
+import sqlite3
 from logging.handlers import RotatingFileHandler
 
 db = SQLAlchemy()
 migrate = Migrate()
 
+@event.listens_for(Engine, "connect")
+def _set_sqlite_pragma(dbapi_connection, connection_record):
+    # WAL lets gunicorn workers read task progress while another process writes
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
 def create_app(with_scheduler=True):
     app = Flask(__name__)
     
@@ -15,6 +27,9 @@ def create_app(with_scheduler=True):
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev')
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///siphon.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        # Wait for concurrent writers (other workers, task progress flusher) instead of failing
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
 
     # Logging Configuration
     if not app.debug and not app.testing:
@@ -47,6 +62,10 @@ def create_app(with_scheduler=True):
     # Register blueprints
     from app.routes import main
     app.register_blueprint(main)
+
+    # CLI commands
+    from app.tasks import tasks_cli
+    app.cli.add_command(tasks_cli)
     
     # Initialize Scheduler
     if with_scheduler:
@@ -31,11 +31,10 @@ DOWNLOAD_BASE_DIR = 'downloads' # Default, should be configurable
 from app.tasks import update_task_progress
 
 def download_video(task_id, video_id, trigger_autotag=True):
-    # We need to create a new app context since this runs in a thread
-    from app import create_app
-    app = create_app(with_scheduler=False)
+    # We need an app context since this runs in a pool thread
+    from app.tasks import task_app_context
     
-    with app.app_context():
+    with task_app_context():
         video = Video.query.get(video_id)
         if not video:
             update_task_progress(task_id, message="Video not found")
@@ -139,13 +138,18 @@ def download_video(task_id, video_id, trigger_autotag=True):
             
             video.status = 'downloaded'
             db.session.commit()
+
+            # Make the new files visible to the next scan's local check right away
+            from app.local_index import local_index
+            for item in downloaded_files:
+                local_index.add_file(item['filename'])
             
             # --- Stash Integration ---
             try:
-                from app.stash import StashClient
+                from app.stash import get_stash_client
                 import time
                 
-                stash = StashClient()
+                stash = get_stash_client()
                 if stash.is_configured():
                     update_task_progress(task_id, progress=99, message=f"Syncing {video.performer.name} with Stash...")
                     
@@ -157,13 +161,16 @@ def download_video(task_id, video_id, trigger_autotag=True):
                         logger.info(f"Stash scan job started: {job_id}")
                         stash.wait_for_job(job_id)
                     
-                    for item in downloaded_files:
-                        filename = item['filename']
+                    # 2. Find Scenes and the Performer (one request for all files)
+                    basenames = [os.path.basename(item['filename']) for item in downloaded_files]
+                    scene_ids, performer_id = stash.find_scenes_for_files(basenames, performer_name=video.performer.name)
+                    if performer_id:
+                        logger.info(f"Found Stash performer {video.performer.name} ({performer_id})")
+                    else:
+                        logger.warning(f"Stash performer not found: {video.performer.name}")
+
+                    for item, basename, scene_id in zip(downloaded_files, basenames, scene_ids):
                         entry_info = item['info']
-                        
-                        # 2. Find Scene
-                        basename = os.path.basename(filename)
-                        scene_id = stash.find_scene_by_path(basename)
                                 
                         # 3. Prepare Metadata & Scrape
                         if scene_id:
@@ -173,14 +180,7 @@ def download_video(task_id, video_id, trigger_autotag=True):
                             if upload_date and len(upload_date) == 8:
                                 formatted_date = f"{upload_date[:4]}-{upload_date[4:6]}-{upload_date[6:]}"
                                 
-                            # Find Performer in Stash
-                            performer_ids = []
-                            performer_id = stash.find_performer(video.performer.name)
-                            if performer_id:
-                                performer_ids.append(performer_id)
-                                logger.info(f"Found Stash performer {video.performer.name} ({performer_id})")
-                            else:
-                                logger.warning(f"Stash performer not found: {video.performer.name}")
+                            performer_ids = [performer_id] if performer_id else []
 
                             video_data = {
                                 'title': entry_info.get('title', video.title),
@@ -0,0 +1,242 @@
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import http.cookiejar
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.http_cache import cache as http_cache
+
+logger = logging.getLogger(__name__)
+
+# Shared HTTP layer for the HTML scrapers. requests.Session is not documented
+# as thread-safe, so each scan thread gets its own session; within a thread the
+# session keeps connections to each host alive across pages.
+HTTP_RETRIES = int(os.environ.get('SCRAPER_HTTP_RETRIES', 3)) # Retries for connection errors and 5xx
+HTTP_BACKOFF = float(os.environ.get('SCRAPER_HTTP_BACKOFF', 0.5)) # Seconds, doubled per retry
+HTTP_POOL_SIZE = 4 # Keep-alive connections per host, per thread
+HTTP_TIMEOUT = 15 # Seconds
+COOKIE_FILE = 'cookies.txt'
+
+# Politeness: a token bucket per host shared by every scraper thread. On 429/503
+# the host is paused (honouring Retry-After) and its rate halved; successful
+# requests then creep the rate back up to the configured value.
+HOST_RATE = float(os.environ.get('SCRAPER_RATE', 2.0)) # Requests per second per host
+HOST_BURST = int(os.environ.get('SCRAPER_BURST', 4)) # Requests allowed back-to-back
+MIN_HOST_RATE = 0.1 # Floor for adaptive slow-down
+THROTTLE_RETRIES = 3 # Attempts after a 429/503 before giving the response back
+THROTTLE_BACKOFF = 5 # Seconds, doubled per attempt when there is no Retry-After
+MAX_RETRY_AFTER = 300 # Seconds; cap on what a server can ask us to wait
+PREFETCH_PAGES = int(os.environ.get('SCRAPER_PREFETCH', 3)) # Listing pages fetched ahead of the parser
+PREFETCH_WORKERS = 8
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+_local = threading.local()
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+_prefetch_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix='prefetch')
+
+_cookie_lock = threading.Lock()
+_cookie_cache = {} # path -> (mtime, {name: value})
+
+class TokenBucket:
+    """Blocking token bucket: acquire() waits until a request may be sent."""
+
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def throttled(self, delay):
+        """Pauses the host for delay seconds and halves its rate."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            self.rate = max(MIN_HOST_RATE, self.rate / 2)
+            self.tokens = 0
+
+    def succeeded(self):
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+def get_bucket(host):
+    with _buckets_lock:
+        bucket = _buckets.get(host)
+        if bucket is None:
+            bucket = _buckets[host] = TokenBucket(HOST_RATE, HOST_BURST)
+        return bucket
+
+def _retry_after(response, attempt):
+    """Seconds to wait after a 429/503: Retry-After (seconds or HTTP date) or exponential backoff."""
+    value = response.headers.get('Retry-After')
+    delay = None
+    if value:
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                delay = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                delay = None
+    if delay is None or delay < 0:
+        delay = THROTTLE_BACKOFF * (2 ** attempt)
+    return min(delay, MAX_RETRY_AFTER)
+
+def _build_session():
+    retry = Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF,
+        status_forcelist=(500, 502, 504),
+        allowed_methods=('GET', 'HEAD'),
+        raise_on_status=False, # Hand the last response back so callers can raise_for_status()
+    )
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def get_session():
+    """Returns this thread's pooled session, creating it on first use."""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = _local.session = _build_session()
+    return session
+
+def load_cookies(path=COOKIE_FILE):
+    """Returns cookies from a Netscape cookies.txt as a dict.
+
+    The file is parsed once and re-read only when its mtime changes. Returns
+    an empty dict if the file is missing or unreadable.
+    """
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+
+    with _cookie_lock:
+        cached = _cookie_cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        try:
+            cj = http.cookiejar.MozillaCookieJar(path)
+            cj.load()
+            cookies = {cookie.name: cookie.value for cookie in cj}
+            logger.info(f"Loaded {len(cookies)} cookies from {path}")
+        except Exception as e:
+            logger.error(f"Error loading cookies: {e}")
+            cookies = {}
+        _cookie_cache[path] = (mtime, cookies)
+        return cookies
+
+def fetch(url, use_cookies=False, timeout=HTTP_TIMEOUT, cached=False, **kwargs):
+    """GETs url through this thread's pooled session, optionally sending cookies.txt.
+
+    Waits for the host's rate limiter before each attempt and retries 429/503
+    responses after the server's Retry-After. The last response is returned
+    either way, so callers keep using raise_for_status().
+
+    With cached=True the request is made conditional on the copy in the HTTP
+    cache; a 304 is turned back into a 200 with the cached body. The response
+    then carries `unchanged` (same body as last time) and `cached_at` (when
+    that body was first seen).
+    """
+    if use_cookies:
+        kwargs['cookies'] = load_cookies()
+    meta = body = None
+    if cached:
+        cache_key = f"{url}|cookies" if use_cookies else url
+        meta, body = http_cache.get(cache_key)
+        if body is not None:
+            kwargs['headers'] = {**kwargs.get('headers', {}), **http_cache.conditional_headers(meta)}
+
+    bucket = get_bucket(urlparse(url).netloc)
+    attempt = 0
+    while True:
+        bucket.acquire()
+        response = get_session().get(url, timeout=timeout, **kwargs)
+        if response.status_code not in (429, 503):
+            bucket.succeeded()
+            break
+        delay = _retry_after(response, attempt)
+        bucket.throttled(delay)
+        if attempt >= THROTTLE_RETRIES:
+            break
+        logger.warning(f"{response.status_code} from {urlparse(url).netloc}; backing off {delay:.0f}s")
+        attempt += 1
+
+    response.unchanged = False
+    response.cached_at = None
+    if cached:
+        if response.status_code == 304 and body is not None:
+            response.status_code = 200
+            response._content = body
+            response.unchanged = True
+            response.cached_at = meta.get('cached_at')
+            http_cache.record('not_modified')
+        elif response.status_code == 200:
+            response.unchanged, response.cached_at = http_cache.store(cache_key, response, meta)
+            http_cache.record('unchanged' if response.unchanged else 'changed')
+    return response
+
+class PagePrefetcher:
+    """Fetches listing pages ahead of the parser.
+
+    get(n) returns page n's response (raising what fetch() raised) and keeps
+    the next `prefetch` pages in flight on the shared prefetch pool; the host's
+    token bucket still decides how fast they actually go out. Pages past
+    last_page are never requested. Call close() when done to drop the rest.
+    With cache_first_page, page 1 goes through the HTTP cache (see fetch()).
+    """
+
+    def __init__(self, page_url, use_cookies=False, prefetch=PREFETCH_PAGES, last_page=None, cache_first_page=False):
+        self.page_url = page_url
+        self.use_cookies = use_cookies
+        self.prefetch = prefetch
+        self.last_page = last_page
+        self.cache_first_page = cache_first_page
+        self.futures = {}
+
+    def get(self, page_number):
+        if page_number == 1 and self.cache_first_page:
+            return fetch(self.page_url(1), use_cookies=self.use_cookies, cached=True)
+        if not self.prefetch:
+            return fetch(self.page_url(page_number), use_cookies=self.use_cookies)
+        for n in range(page_number, page_number + self.prefetch + 1):
+            if self.last_page and n > self.last_page:
+                break
+            if n not in self.futures and not (n == 1 and self.cache_first_page):
+                self.futures[n] = _prefetch_pool.submit(fetch, self.page_url(n), use_cookies=self.use_cookies)
+        return self.futures.pop(page_number).result()
+
+    def close(self):
+        for future in self.futures.values():
+            future.cancel()
+        self.futures.clear()
@@ -0,0 +1,193 @@
+from datetime import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# On-disk cache for listing pages. Each URL keeps its last body plus the
+# validators (ETag / Last-Modified) and a body hash, so the next scan can send
+# a conditional request and tell whether the page changed at all. Entries are
+# evicted least-recently-used (by file mtime) once the directory passes its size cap.
+CACHE_DIR = os.environ.get('SCRAPER_CACHE_DIR', os.path.join('cache', 'http'))
+CACHE_MAX_BYTES = int(os.environ.get('SCRAPER_CACHE_MAX_MB', 64)) * 1024 * 1024
+# Hit/miss counters are per process; each one adds its counts to the shared
+# totals in Settings (http_cache_<outcome>) at most this often, and whenever
+# the settings page reads them.
+STATS_SAVE_SECONDS = 30
+STAT_NAMES = ('requests', 'not_modified', 'unchanged', 'changed', 'evicted')
+
+class HttpCache:
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.size = None # Bytes on disk, computed lazily on first store
+        self.stats = dict.fromkeys(STAT_NAMES, 0) # Not yet added to the totals in Settings
+        self.stats_saved_at = time.time()
+
+    def _paths(self, key):
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.directory, f'{digest}.json'), os.path.join(self.directory, f'{digest}.body')
+
+    def get(self, key):
+        """Returns (meta, body bytes) for key, or (None, None)."""
+        meta_path, body_path = self._paths(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None, None
+        # Touch for LRU ordering
+        try:
+            os.utime(meta_path)
+        except OSError:
+            pass
+        return meta, body
+
+    def conditional_headers(self, meta):
+        headers = {}
+        if meta:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def store(self, key, response, previous=None):
+        """Saves a 200 response. Returns (unchanged, cached_at).
+
+        unchanged is True when the body hashes the same as the previous entry;
+        cached_at is when this exact body was first stored.
+        """
+        body = response.content
+        body_hash = hashlib.sha1(body).hexdigest()
+        unchanged = bool(previous) and previous.get('body_hash') == body_hash
+        meta = {
+            'url': response.url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'body_hash': body_hash,
+            'cached_at': previous['cached_at'] if unchanged else datetime.utcnow().isoformat(),
+        }
+        meta_path, body_path = self._paths(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            old_size = self._entry_size(meta_path, body_path)
+            if not unchanged:
+                with open(body_path + '.tmp', 'wb') as f:
+                    f.write(body)
+                os.replace(body_path + '.tmp', body_path)
+            with open(meta_path + '.tmp', 'w') as f:
+                json.dump(meta, f)
+            os.replace(meta_path + '.tmp', meta_path)
+            self._grew(self._entry_size(meta_path, body_path) - old_size)
+        except OSError as e:
+            logger.warning(f"Could not write HTTP cache entry: {e}")
+        return unchanged, meta['cached_at']
+
+    def record(self, outcome):
+        with self.lock:
+            self.stats['requests'] += 1
+            self.stats[outcome] += 1
+            due = time.time() - self.stats_saved_at >= STATS_SAVE_SECONDS
+        if due:
+            self.save_stats()
+
+    def save_stats(self):
+        """Adds this process's counts to the totals in Settings (needs an app context)."""
+        from flask import has_app_context
+        if not has_app_context():
+            return
+        with self.lock:
+            counts = {name: n for name, n in self.stats.items() if n}
+            self.stats = dict.fromkeys(STAT_NAMES, 0)
+            self.stats_saved_at = time.time()
+        if not counts:
+            return
+        from app import db
+        from app.models import Settings
+        table = Settings.__table__
+        try:
+            with db.engine.begin() as conn:
+                for name, n in counts.items():
+                    key = f'http_cache_{name}'
+                    # Increment in SQL so workers saving at the same time don't lose counts
+                    if not conn.execute(table.update().where(table.c.key == key).values(
+                            value=db.cast(db.cast(table.c.value, db.Integer) + n, db.Text))).rowcount:
+                        conn.execute(table.insert().values(key=key, value=str(n)))
+        except Exception as e:
+            logger.warning(f"Could not save HTTP cache stats: {e}")
+            with self.lock:
+                for name, n in counts.items():
+                    self.stats[name] += n
+
+    def get_stats(self):
+        """Totals over all workers, plus the cache's size on disk."""
+        from app.models import Settings
+        self.save_stats()
+        keys = {f'http_cache_{name}': name for name in STAT_NAMES}
+        stats = dict.fromkeys(STAT_NAMES, 0)
+        for setting in Settings.query.filter(Settings.key.in_(keys)):
+            stats[keys[setting.key]] = int(setting.value or 0)
+        hits = stats['not_modified'] + stats['unchanged']
+        stats['hit_rate'] = round(100 * hits / stats['requests'], 1) if stats['requests'] else 0
+        # Other workers store entries too, so this process's running total is not enough
+        try:
+            stats['size'] = self._scan_size()
+        except OSError:
+            stats['size'] = 0
+        return stats
+
+    def _entry_size(self, *paths):
+        total = 0
+        for path in paths:
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+    def _grew(self, delta):
+        with self.lock:
+            if self.size is None:
+                self.size = self._scan_size()
+            else:
+                self.size += delta
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _scan_size(self):
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                total += entry.stat().st_size
+        return total
+
+    def _evict(self):
+        """Deletes least recently used entries until the cache is at 90% of its cap (lock held)."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                body_path = entry.path[:-len('.json')] + '.body'
+                entries.append((entry.stat().st_mtime, entry.path, body_path))
+        entries.sort()
+        target = self.max_bytes * 0.9
+        for _, meta_path, body_path in entries:
+            if self.size <= target:
+                break
+            freed = self._entry_size(meta_path, body_path)
+            for path in (meta_path, body_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.size -= freed
+            self.stats['evicted'] += 1
+
+cache = HttpCache()
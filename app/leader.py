@@ -0,0 +1,51 @@
+from app import db
+from app.models import Lease
+from datetime import datetime, timedelta
+from sqlalchemy import case, or_
+from sqlalchemy.exc import IntegrityError
+
+# Leases are rows in the lease table: whoever holds an unexpired row owns the
+# named role. Holders renew well before expiry; if a process dies its lease
+# simply runs out and the next process to try takes over.
+
+def acquire_lease(name, owner, ttl):
+    """Takes or renews lease `name` for `owner` for `ttl` seconds.
+
+    Returns True if owner now holds the lease. Runs in its own transaction so
+    it can be called from any thread without touching the caller's session.
+    """
+    table = Lease.__table__
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl)
+    with db.engine.begin() as conn:
+        result = conn.execute(
+            table.update()
+            .where(table.c.name == name)
+            .where(or_(table.c.owner == owner, table.c.owner.is_(None), table.c.expires_at < now))
+            .values(owner=owner, expires_at=expires_at,
+                    acquired_at=case((table.c.owner == owner, table.c.acquired_at), else_=now))
+        )
+        if result.rowcount:
+            return True
+
+    # No row yet (first start) - racing inserts are settled by the primary key
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(table.insert().values(name=name, owner=owner, expires_at=expires_at, acquired_at=now))
+        return True
+    except IntegrityError:
+        return False
+
+def release_lease(name, owner):
+    """Gives up lease `name` if owner holds it, so another process can take over immediately."""
+    table = Lease.__table__
+    with db.engine.begin() as conn:
+        conn.execute(table.update().where(table.c.name == name, table.c.owner == owner)
+                     .values(owner=None, expires_at=None))
+
+def get_lease_holder(name):
+    """Returns the owner of an unexpired lease `name`, or None."""
+    lease = db.session.get(Lease, name)
+    if lease and lease.owner and lease.expires_at and lease.expires_at > datetime.utcnow():
+        return lease.owner
+    return None
@@ -0,0 +1,197 @@
+import logging
+import os
+import threading
+import time
+from app.local_index import local_index, filename_tokens, get_local_path, get_local_roots
+
+logger = logging.getLogger(__name__)
+
+# Optional live view of the local library. The watcher gets create/delete/move
+# events from watchdog (inotify on Linux) and applies them to the local index
+# as they happen. If watchdog is missing or its observer can't start (e.g. the
+# inotify watch limit is reached), it falls back to re-running the
+# mtime-incremental refresh every WATCH_POLL_SECONDS. Either way scans stop walking the library
+# themselves, and a deleted file reverts its 'downloaded' video to 'new'
+# right away. Only the scheduler leader runs the watcher (see scheduler.leader_heartbeat).
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    WATCH_MODE = 'events'
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+    WATCH_MODE = 'polling'
+
+WATCH_POLL_SECONDS = int(os.environ.get('LOCAL_WATCH_POLL_SECONDS', 30))
+FLUSH_SECONDS = 2 # Events are batched this long before reverting statuses and saving the index
+REVERT_BATCH = 500 # Viewkeys per IN query (SQLite variable limit)
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if event.is_directory:
+            # A directory moved or copied in arrives as one event; pick up its contents with a refresh
+            self.watcher.rescan_needed = True
+        else:
+            local_index.add_file(event.src_path)
+
+    def on_deleted(self, event):
+        if event.is_directory:
+            self.watcher.removed(local_index.remove_dir(event.src_path))
+        elif local_index.remove_file(event.src_path):
+            self.watcher.removed([os.path.abspath(event.src_path)])
+
+    def on_moved(self, event):
+        self.on_deleted(event)
+        if event.is_directory:
+            self.watcher.rescan_needed = True
+        elif self.watcher.is_watched(event.dest_path):
+            local_index.add_file(event.dest_path)
+
+class LibraryWatcher:
+    def __init__(self, app, roots):
+        self.app = app
+        self.roots = roots
+        self.observer = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.pending = [] # Removed file paths waiting for a status revert
+        self.rescan_needed = False
+
+    def is_watched(self, path):
+        path = os.path.abspath(path)
+        return any(path.startswith(os.path.join(root, '')) for root in self.roots)
+
+    def removed(self, paths):
+        if paths:
+            with self.lock:
+                self.pending.extend(paths)
+
+    def start(self):
+        # Events start flowing first so nothing is missed while _run catches up
+        if Observer is not None:
+            self.observer = Observer()
+            handler = _EventHandler(self)
+            try:
+                for root in self.roots:
+                    # Site paths nested in local_scan_path are already covered recursively
+                    if os.path.isdir(root) and not any(root != other and root.startswith(os.path.join(other, ''))
+                                                       for other in self.roots):
+                        self.observer.schedule(handler, root, recursive=True)
+                self.observer.daemon = True
+                self.observer.start()
+            except OSError as e:
+                logger.error(f"Library watcher can't use filesystem events, polling instead: {e}")
+                self.observer.stop()
+                self.observer = None
+        self.thread = threading.Thread(target=self._run, name='library-watcher', daemon=True)
+        self.thread.start()
+        mode = 'events' if self.observer is not None else 'polling'
+        print(f"Watching local library ({mode}): {', '.join(self.roots)}")
+
+    def stop(self):
+        local_index.live_roots = None
+        self.stop_event.set()
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join(timeout=5)
+        if self.thread is not None:
+            self.thread.join(timeout=FLUSH_SECONDS * 2)
+        print("Stopped watching local library.")
+
+    def _run(self):
+        # Catch up on whatever changed while nobody was watching. On a large
+        # library this walk is long, so it runs here rather than on the
+        # heartbeat that started us; scans keep refreshing on their own until
+        # it is done and the roots are marked live.
+        try:
+            self.removed(local_index.refresh(self.roots, force=True))
+        except Exception as e:
+            logger.error(f"Library watcher error: {e}")
+        if self.stop_event.is_set():
+            return
+        local_index.live_roots = self.roots
+        last_poll = time.time()
+        while not self.stop_event.wait(FLUSH_SECONDS):
+            try:
+                polling = self.observer is None and time.time() - last_poll >= WATCH_POLL_SECONDS
+                if polling or self.rescan_needed:
+                    self.rescan_needed = False
+                    self.removed(local_index.refresh(self.roots, force=True))
+                    last_poll = time.time()
+                self._flush()
+            except Exception as e:
+                logger.error(f"Library watcher error: {e}")
+
+    def _flush(self):
+        with self.lock:
+            paths, self.pending = self.pending, []
+        if paths:
+            with self.app.app_context():
+                revert_missing_videos(paths)
+        local_index.save()
+
+def revert_missing_videos(paths):
+    """Sets 'downloaded' videos whose files were among paths back to 'new', unless a copy remains.
+
+    Follows the scan's rules: only when local checks are on, and a video still
+    found in Stash (when Stash checks are on) keeps its status.
+    """
+    from app import db
+    from app.models import Video, Settings
+    from app.stash import get_stash_client
+
+    local_check_setting = Settings.query.filter_by(key='local_check_existing').first()
+    if local_check_setting and local_check_setting.value != 'true':
+        return 0
+    stash_check_setting = Settings.query.filter_by(key='stash_check_existing').first()
+    check_stash = stash_check_setting.value == 'true' if stash_check_setting else True
+
+    keys = set()
+    for path in paths:
+        keys.update(filename_tokens(os.path.basename(path)))
+    keys = list(keys)
+
+    stash = get_stash_client() if check_stash else None
+    local_paths = {}
+    reverted = 0
+    for i in range(0, len(keys), REVERT_BATCH):
+        videos = Video.query.filter(Video.status == 'downloaded', Video.viewkey.in_(keys[i:i + REVERT_BATCH])).all()
+        missing = []
+        for vid in videos:
+            site = vid.performer.site
+            if site not in local_paths:
+                local_paths[site] = get_local_path(site)
+            media_ids = vid.media_ids.split(',') if vid.media_ids else []
+            if not (local_paths[site] and local_index.contains(local_paths[site], [vid.viewkey] + media_ids)):
+                missing.append(vid)
+        in_stash = stash.check_videos_exist([{'url': v.url, 'title': v.title} for v in missing]) if stash else [False] * len(missing)
+        for vid, found in zip(missing, in_stash):
+            if not found:
+                vid.status = 'new'
+                reverted += 1
+    if reverted:
+        db.session.commit()
+        print(f"Library watcher: {reverted} video(s) no longer on disk, marked as new.")
+    return reverted
+
+_watcher = None
+
+def sync_library_watcher(app, leader):
+    """Starts, restarts or stops this process's watcher to match Settings and leadership."""
+    global _watcher
+    from app.models import Settings
+
+    setting = Settings.query.filter_by(key='local_watch').first()
+    enabled = leader and setting is not None and setting.value == 'true'
+    roots = sorted(os.path.abspath(r) for r in get_local_roots()) if enabled else []
+
+    if _watcher and _watcher.roots != roots:
+        _watcher.stop()
+        _watcher = None
+    if roots and _watcher is None:
+        _watcher = LibraryWatcher(app, roots)
+        _watcher.start()
@@ -0,0 +1,254 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Index of the local video library: id tokens from filenames -> file paths.
+# Downloads are named '<title> [<id>].<ext>', so a video is on disk when its
+# viewkey (or one of its media ids) appears as a token. The directory listing
+# is persisted with each directory's mtime; a refresh only re-lists
+# directories whose mtime changed (a file was added, removed or renamed in
+# them) and just stats the rest. One index covers local_scan_path and all the
+# per-site paths, shared by every performer's scan.
+INDEX_PATH = os.environ.get('LOCAL_INDEX_PATH', os.path.join('cache', 'local_index.json'))
+REFRESH_SECONDS = int(os.environ.get('LOCAL_INDEX_REFRESH_SECONDS', 60)) # Reuse a refresh this recent
+MIN_TOKEN_LENGTH = 6 # Bare words shorter than this are title noise, not ids
+MTIME_SLACK = 2 # Seconds; coarse filesystem clocks can hide a change made right after listing
+
+LOCAL_PATH_KEYS = ('local_scan_path', 'local_scan_path_pornhub', 'local_scan_path_xhamster', 'local_scan_path_x')
+
+BRACKET_RE = re.compile(r'\[([^\[\]]+)\]')
+WORD_RE = re.compile(r'[A-Za-z0-9]+')
+
+def filename_tokens(name):
+    """Id-like tokens in a filename: bracketed parts plus long alphanumeric runs."""
+    stem = os.path.splitext(name)[0]
+    tokens = set(BRACKET_RE.findall(stem))
+    tokens.update(w for w in WORD_RE.findall(stem) if len(w) >= MIN_TOKEN_LENGTH)
+    return tokens
+
+def get_local_roots():
+    """All configured local library paths (main and per-site)."""
+    from app.models import Settings
+    roots = []
+    for key in LOCAL_PATH_KEYS:
+        setting = Settings.query.filter_by(key=key).first()
+        if setting and setting.value and setting.value not in roots:
+            roots.append(setting.value)
+    return roots
+
+def get_local_path(site):
+    """The library path scans of site check against: its override, else local_scan_path."""
+    from app.models import Settings
+    setting = Settings.query.filter_by(key=f'local_scan_path_{site}').first()
+    if not (setting and setting.value):
+        setting = Settings.query.filter_by(key='local_scan_path').first()
+    return setting.value if (setting and setting.value) else None
+
+def _under(path, root):
+    root = os.path.join(root, '')
+    return path.startswith(root)
+
+class LocalIndex:
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self.lock = threading.RLock()
+        self.dirs = None # dir path -> {'mtime', 'files', 'subdirs'}; loaded lazily
+        self.tokens = {} # token -> set of file paths
+        self.refreshed_at = 0
+        self.refreshed_roots = None
+        self.live_roots = None # Set while a watcher keeps these roots current (see library_watcher)
+        self.dirty = False
+        self.stats = {'refreshes': 0, 'dirs_listed': 0, 'dirs_reused': 0}
+
+    def _load(self):
+        """Reads the persisted listing (lock held)."""
+        if self.dirs is not None:
+            return
+        self.dirs = {}
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.dirs = {d: {'mtime': mtime, 'files': files, 'subdirs': subdirs}
+                         for d, (mtime, files, subdirs) in data.get('dirs', {}).items()}
+        except (OSError, ValueError, TypeError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.warning(f"Ignoring unreadable local index {self.path}: {e}")
+        for d, entry in self.dirs.items():
+            for name in entry['files']:
+                self._add_tokens(os.path.join(d, name))
+
+    def _save(self):
+        """Writes the listing back if it changed (lock held)."""
+        if not self.dirty:
+            return
+        data = {'dirs': {d: [e['mtime'], e['files'], e['subdirs']] for d, e in self.dirs.items()}}
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+        except OSError as e:
+            logger.warning(f"Could not write local index: {e}")
+
+    def _add_tokens(self, path):
+        for token in filename_tokens(os.path.basename(path)):
+            self.tokens.setdefault(token, set()).add(path)
+
+    def _remove_tokens(self, path):
+        for token in filename_tokens(os.path.basename(path)):
+            paths = self.tokens.get(token)
+            if paths:
+                paths.discard(path)
+                if not paths:
+                    del self.tokens[token]
+
+    def _drop_dir(self, d, removed):
+        entry = self.dirs.pop(d, None)
+        if entry:
+            for name in entry['files']:
+                self._remove_tokens(os.path.join(d, name))
+                removed.append(os.path.join(d, name))
+            self.dirty = True
+
+    def _list_dir(self, d, mtime, entry, removed):
+        """Re-lists one directory and applies the difference to the tokens (lock held)."""
+        files, subdirs = [], []
+        with os.scandir(d) as it:
+            for item in it:
+                try:
+                    if item.is_dir(follow_symlinks=False):
+                        subdirs.append(item.name)
+                    elif item.is_file():
+                        files.append(item.name)
+                except OSError:
+                    continue
+        old_files = set(entry['files']) if entry else set()
+        for name in old_files.difference(files):
+            self._remove_tokens(os.path.join(d, name))
+            removed.append(os.path.join(d, name))
+        for name in set(files).difference(old_files):
+            self._add_tokens(os.path.join(d, name))
+        # Don't trust an mtime this close to now: a change in the same clock tick would go unseen
+        trusted = mtime if time.time() - mtime > MTIME_SLACK else None
+        self.dirs[d] = {'mtime': trusted, 'files': files, 'subdirs': subdirs}
+        self.dirty = True
+        self.stats['dirs_listed'] += 1
+        return subdirs
+
+    def refresh(self, roots, force=False):
+        """Brings the index up to date for roots, re-listing only changed directories.
+
+        Returns the paths of files that disappeared since the last refresh.
+        """
+        roots = sorted(os.path.abspath(r) for r in roots if r)
+        with self.lock:
+            self._load()
+            if not force:
+                if roots == self.live_roots:
+                    return [] # A watcher is applying changes as they happen
+                if roots == self.refreshed_roots and time.time() - self.refreshed_at < REFRESH_SECONDS:
+                    return []
+            removed = []
+            seen = set()
+            stack = list(roots)
+            while stack:
+                d = stack.pop()
+                if d in seen:
+                    continue # Site paths nested inside local_scan_path are walked once
+                seen.add(d)
+                try:
+                    mtime = os.stat(d).st_mtime
+                except OSError:
+                    continue
+                entry = self.dirs.get(d)
+                if entry and entry['mtime'] == mtime:
+                    subdirs = entry['subdirs']
+                    self.stats['dirs_reused'] += 1
+                else:
+                    try:
+                        subdirs = self._list_dir(d, mtime, entry, removed)
+                    except OSError as e:
+                        logger.warning(f"Error indexing {d}: {e}")
+                        continue
+                stack.extend(os.path.join(d, name) for name in subdirs)
+            # Directories that were deleted or are no longer under a configured root
+            for d in [d for d in self.dirs if d not in seen]:
+                self._drop_dir(d, removed)
+            self.refreshed_roots = roots
+            self.refreshed_at = time.time()
+            self.stats['refreshes'] += 1
+            self._save()
+            return removed
+
+    def find(self, root, keys):
+        """Paths under root whose filename carries any of keys."""
+        root = os.path.abspath(root)
+        with self.lock:
+            self._load()
+            found = []
+            for key in keys:
+                found.extend(p for p in self.tokens.get(key, ()) if _under(p, root))
+            return found
+
+    def contains(self, root, keys):
+        return bool(self.find(root, [k for k in keys if k]))
+
+    def add_file(self, path):
+        """Records a file written by the app (e.g. a finished download) without waiting for a refresh."""
+        path = os.path.abspath(path)
+        d, name = os.path.split(path)
+        with self.lock:
+            self._load()
+            entry = self.dirs.setdefault(d, {'mtime': None, 'files': [], 'subdirs': []})
+            if name not in entry['files']:
+                entry['files'].append(name)
+                self._add_tokens(path)
+            # The directory changed under us; re-list it on the next refresh
+            entry['mtime'] = None
+            self.dirty = True
+
+    def remove_file(self, path):
+        """Forgets a deleted file. Returns True if it was indexed."""
+        path = os.path.abspath(path)
+        d, name = os.path.split(path)
+        with self.lock:
+            self._load()
+            entry = self.dirs.get(d)
+            if not (entry and name in entry['files']):
+                return False
+            entry['files'].remove(name)
+            self._remove_tokens(path)
+            entry['mtime'] = None
+            self.dirty = True
+            return True
+
+    def remove_dir(self, path):
+        """Forgets a directory and everything below it. Returns the removed file paths."""
+        path = os.path.abspath(path)
+        removed = []
+        with self.lock:
+            self._load()
+            for d in [d for d in self.dirs if d == path or _under(d, path)]:
+                self._drop_dir(d, removed)
+        return removed
+
+    def save(self):
+        with self.lock:
+            self._save()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['dirs'] = len(self.dirs or {})
+            stats['files'] = sum(len(e['files']) for e in (self.dirs or {}).values())
+            stats['tokens'] = len(self.tokens)
+        return stats
+
+local_index = LocalIndex()
@@ -1,5 +1,6 @@
 from app import db
 from datetime import datetime
+import json
 
 class Performer(db.Model):
     id = db.Column(db.String(64), primary_key=True)
@@ -13,6 +14,9 @@ class Performer(db.Model):
     use_cookies = db.Column(db.Boolean, default=False)
     min_duration = db.Column(db.Integer, default=0) # Minimum duration in minutes
     last_scan = db.Column(db.DateTime, nullable=True)
+    last_deep_scan = db.Column(db.DateTime, nullable=True) # Last full-history scan
+    next_scan_at = db.Column(db.DateTime, nullable=True, index=True) # When the scheduler should scan next
+    scan_interval_override = db.Column(db.Integer, nullable=True) # Fixed interval in minutes (bypasses adaptive)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     videos = db.relationship('Video', backref='performer', lazy='dynamic')
@@ -59,3 +63,88 @@ class Settings(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     key = db.Column(db.String(64), unique=True, nullable=False)
     value = db.Column(db.Text, nullable=True)
+
+class Task(db.Model):
+    id = db.Column(db.String(36), primary_key=True) # uuid4
+    name = db.Column(db.String(128), nullable=True) # Function name, e.g. 'download_video'
+    status = db.Column(db.String(32), default='pending', index=True) # 'pending', 'running', 'completed', 'failed'
+    progress = db.Column(db.Float, default=0)
+    message = db.Column(db.Text, nullable=True)
+    total_bytes = db.Column(db.BigInteger, default=0)
+    downloaded_bytes = db.Column(db.BigInteger, default=0)
+    result = db.Column(db.Text, nullable=True) # JSON encoded return value
+    batch_id = db.Column(db.String(36), nullable=True, index=True)
+    dedupe_key = db.Column(db.String(128), nullable=True) # e.g. 'download:123', 'scan:performer'
+    # Persisted queue entry, so resumable tasks survive a restart
+    func = db.Column(db.String(256), nullable=True) # 'module:function', set only for resumable tasks
+    args = db.Column(db.Text, nullable=True) # JSON: {'args': [...], 'kwargs': {...}}
+    pool = db.Column(db.String(32), nullable=True)
+    priority = db.Column(db.Integer, nullable=True)
+    group_key = db.Column(db.String(64), nullable=True)
+    attempts = db.Column(db.Integer, default=0)
+    owner = db.Column(db.String(128), nullable=True, index=True) # Process running/queueing it; NULL = orphaned
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Dashboard reads "last N finished" straight off this index
+        db.Index('ix_task_status_finished_at', 'status', 'finished_at'),
+        # At most one in-flight task per dedupe_key, enforced across workers
+        db.Index('ix_task_dedupe_key_active', 'dedupe_key', unique=True,
+                 sqlite_where=db.text("status IN ('pending', 'running')"),
+                 postgresql_where=db.text("status IN ('pending', 'running')")),
+    )
+
+    def to_dict(self):
+        result = None
+        if self.result:
+            try:
+                result = json.loads(self.result)
+            except ValueError:
+                result = self.result
+        return {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'progress': self.progress or 0,
+            'message': self.message or '',
+            'total_bytes': self.total_bytes or 0,
+            'downloaded_bytes': self.downloaded_bytes or 0,
+            'result': result,
+            'batch_id': self.batch_id,
+            'pool': self.pool,
+            'group_key': self.group_key,
+            'attempts': self.attempts or 0,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+class Lease(db.Model):
+    """A named lock held by one process until expires_at (renewed by heartbeat)."""
+    name = db.Column(db.String(64), primary_key=True) # e.g. 'scheduler'
+    owner = db.Column(db.String(128), nullable=True) # tasks.PROCESS_ID of the holder
+    expires_at = db.Column(db.DateTime, nullable=True)
+    acquired_at = db.Column(db.DateTime, nullable=True)
+
+class StashScene(db.Model):
+    """Local copy of a Stash scene, kept in sync by app/stash_mirror.py."""
+    id = db.Column(db.String(32), primary_key=True) # Stash scene id
+    title = db.Column(db.String(512), nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=True, index=True) # Stash's updated_at, in UTC
+    synced_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    keys = db.relationship('StashSceneKey', backref='scene', lazy='dynamic', cascade='all, delete-orphan')
+
+class StashSceneKey(db.Model):
+    """One lookup key of a mirrored scene: a URL, a file path, or an id token or word from a file name."""
+    id = db.Column(db.Integer, primary_key=True)
+    scene_id = db.Column(db.String(32), db.ForeignKey('stash_scene.id', ondelete='CASCADE'), nullable=False, index=True)
+    kind = db.Column(db.String(8), nullable=False) # 'url', 'path', 'token', 'word'
+    value = db.Column(db.String(1024), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_stash_scene_key_kind_value', 'kind', 'value'),
+    )
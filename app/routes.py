@@ -1,6 +1,6 @@
 from flask import Blueprint, render_template, request, jsonify, make_response
 import os
-from datetime import datetime
+from datetime import datetime, timezone
 from app.models import Performer, Video, db
 from app.scraper import scrape_performer
 from app.downloader import download_video
@@ -8,30 +8,44 @@ import os
 
 main = Blueprint('main', __name__)
 
-def run_scan_task(task_id, performer_id):
-    from app import create_app
-    app = create_app(with_scheduler=False)
+def run_scan_task(task_id, performer_id, mode=None):
+    from app.tasks import task_app_context
     
-    with app.app_context():
+    with task_app_context():
         from app.models import Performer
         from app.services import scan_performer_service
-        from app.tasks import update_task_progress
+        from app.tasks import update_task_progress, task_kwargs
         
         performer = Performer.query.get(performer_id)
         if not performer:
             update_task_progress(task_id, message="Performer not found", status="failed")
             return
             
-        result = scan_performer_service(performer, task_id)
+        # A deep scan requested while this one was queued upgrades it
+        mode = task_kwargs(task_id).get('mode') or mode
+        result = scan_performer_service(performer, task_id, mode=mode)
         
 
         return result
 
 @main.route('/scan/<performer_id>', methods=['POST'])
 def scan_performer(performer_id):
-    from app.tasks import start_task
-    task_id = start_task(run_scan_task, performer_id)
-    return render_template('components/progress_bar.html', task_id=task_id, message="Initializing scan...", progress=0)
+    from app.tasks import start_task, task_kwargs, PRIORITY_INTERACTIVE
+    from app.scraper import SCAN_MODE_DEEP
+    # 'deep' forces a full-history scan; otherwise the mode is picked when the task runs
+    mode = SCAN_MODE_DEEP if request.values.get('mode') == SCAN_MODE_DEEP else None
+    site = db.session.query(Performer.site).filter_by(id=performer_id).scalar()
+    # A deep request upgrades a scan of this performer that is still queued
+    task_id = start_task(run_scan_task, performer_id, pool='scan', priority=PRIORITY_INTERACTIVE,
+                         group=performer_id, site=site, dedupe_key=f'scan:{performer_id}',
+                         upgrade={'mode': mode} if mode else None)
+    if not mode:
+        message = "Initializing scan..."
+    elif task_kwargs(task_id).get('mode') == mode:
+        message = "Initializing deep scan..."
+    else:
+        message = "A scan is already running; start the deep scan again once it finishes."
+    return render_template('components/progress_bar.html', task_id=task_id, message=message, progress=0)
 
 
 
@@ -107,6 +121,11 @@ def update_performer_settings(performer_id):
         performer.min_duration = int(request.form.get('min_duration', 0))
     except ValueError:
         performer.min_duration = 0
+    override = request.form.get('scan_interval_override', '')
+    performer.scan_interval_override = int(override) if override.isdigit() and int(override) > 0 else None
+    # Re-plan from now so a new override takes effect on the next tick
+    from app.services import schedule_next_scan
+    schedule_next_scan(performer)
     db.session.commit()
     return "<div class='alert alert-success'>Settings saved!</div>"
 
@@ -161,29 +180,33 @@ def download_batch():
     if not video_ids:
         return "<div class='alert alert-warning'>No videos selected.</div>"
         
-    from app.tasks import start_task
+    from app.tasks import start_task, Batch, PRIORITY_BATCH
     from app.downloader import download_video
     
-    # We will return a main message + OOB swaps for each video button
-    response_content = ""
-    
-    # Monitor batch completion (no global callback needed anymore)
-    from app.tasks import monitor_batch_completion
+    # Group by performer so batches for different performers share the download lane fairly
+    performer_ids = dict(db.session.query(Video.id, Video.performer_id).filter(Video.id.in_(video_ids)).all())
     
-    # Collect all task IDs created in the loop
-    all_task_ids = []
+    # We will return a batch summary + OOB swaps for each video button
+    response_content_parts = []
+    batch = Batch()
     for vid in video_ids:
         # Enable per-video tagging now that it is targeted and safe
-        task_id = start_task(download_video, vid, trigger_autotag=True)
-        all_task_ids.append(task_id)
+        task_id = start_task(download_video, vid, trigger_autotag=True, pool='download', batch=batch,
+                             priority=PRIORITY_BATCH, group=performer_ids.get(int(vid)) if vid.isdigit() else None,
+                             dedupe_key=f'download:{vid}', resumable=True)
         
         pb_html = render_template('components/progress_bar.html', task_id=task_id, message="Queued", progress=0)
-        response_content += f'<div hx-swap-oob="outerHTML:#btn-download-{vid}">{pb_html}</div>'
+        response_content_parts.append(f'<div hx-swap-oob="outerHTML:#btn-download-{vid}">{pb_html}</div>')
         # Also remove the ignore button via OOB
-        response_content += f'<div hx-swap-oob="delete:#btn-ignore-{vid}"></div>'
+        response_content_parts.append(f'<div hx-swap-oob="delete:#btn-ignore-{vid}"></div>')
 
-    monitor_batch_completion(all_task_ids, None)
+    # Completion is event-driven: the batch fires when its last task finishes
+    batch.seal()
     
+    # Videos already downloading elsewhere attach to their existing task and are not part of the batch
+    batch_progress = batch.progress()
+    response_content = render_template('components/batch_progress.html', batch=batch_progress, batch_id=batch.id) if batch_progress else ""
+    response_content += "".join(response_content_parts)
     return response_content
 
 @main.route('/ignore/batch', methods=['POST'])
@@ -218,23 +241,29 @@ def unignore_batch():
 
 @main.route('/download/<int:video_id>', methods=['POST'])
 def download_video_route(video_id):
-    from app.tasks import start_task
+    from app.tasks import start_task, PRIORITY_INTERACTIVE
     from app.downloader import download_video
     
-    task_id = start_task(download_video, video_id)
+    performer_id = db.session.query(Video.performer_id).filter_by(id=video_id).scalar()
+    task_id = start_task(download_video, video_id, pool='download', priority=PRIORITY_INTERACTIVE, group=performer_id,
+                         dedupe_key=f'download:{video_id}', resumable=True)
     
     # Return initial progress bar and remove ignore button
     pb_html = render_template('components/progress_bar.html', task_id=task_id, message="Starting download...", progress=0)
     return f'{pb_html}<div hx-swap-oob="delete:#btn-ignore-{video_id}"></div>'
 
-@main.route('/task/status/<task_id>', methods=['GET'])
-def task_status(task_id):
-    from app.tasks import get_task_progress
-    task = get_task_progress(task_id)
+@main.route('/batch/status/<batch_id>', methods=['GET'])
+def batch_status(batch_id):
+    from app.tasks import get_batch_progress
+    batch = get_batch_progress(batch_id)
     
-    if not task:
-        return "Task not found", 404
+    if not batch:
+        return "Batch not found", 404
         
+    return render_template('components/batch_progress.html', batch=batch, batch_id=batch_id)
+
+def render_task_status(task_id, task):
+    """Renders the HTMX fragment for a task's current state (progress bar or final result)."""
     if task['status'] == 'completed':
         # Check if it was a scan task (result has 'new_count')
         if task.get('result') and isinstance(task['result'], dict) and 'new_count' in task['result']:
@@ -271,7 +300,68 @@ def task_status(task_id):
         return render_template('components/progress_bar.html', 
                              task_id=task_id, 
                              message=task['message'], 
-                             progress=task['progress'])
+                             progress=task['progress'],
+                             queue_position=task.get('queue_position'))
+
+@main.route('/task/status/<task_id>', methods=['GET'])
+def task_status(task_id):
+    from app.tasks import get_task_progress
+    task = get_task_progress(task_id)
+    
+    if not task:
+        return "Task not found", 404
+        
+    return render_task_status(task_id, task)
+
+def sse_event(event, html):
+    """Formats an HTML fragment as a Server-Sent Event (one data: line per line of HTML)."""
+    lines = html.strip().splitlines() or ['']
+    return f"event: {event}\n" + "".join(f"data: {line}\n" for line in lines) + "\n"
+
+@main.route('/task/stream', methods=['GET'])
+def task_stream():
+    """
+    One SSE connection per page. Pushes a `task-<id>` event whenever a task's
+    progress, message or status changes (and `batch-<id>` for its batch).
+    Progress fragments subscribe with sse-swap instead of polling
+    /task/status. ?performer=<id> and ?pool=<name> limit the stream to the
+    tasks the page can show; events are rendered once per process by
+    app.task_feed and shared by all streams. A stream closes after
+    TASK_STREAM_LIFETIME (five minutes) and the browser reconnects, getting
+    recently finished tasks replayed.
+    """
+    import time
+    from flask import Response, current_app
+    from app.task_feed import task_feed, TASK_STREAM_LIFETIME, TASK_STREAM_KEEPALIVE, TASK_STREAM_BUSY_RETRY
+
+    performer = request.args.get('performer')
+    pool = request.args.get('pool')
+
+    def matches(event):
+        return (not performer or performer in event['groups']) and (not pool or pool in event['pools'])
+
+    app = current_app._get_current_object()
+
+    def generate():
+        subscriber = task_feed.subscribe(app, matches)
+        if subscriber is None:
+            # Too many open streams in this worker: have the browser come back later instead of waiting on a thread
+            yield f"retry: {TASK_STREAM_BUSY_RETRY * 1000}\n\n"
+            return
+        try:
+            yield "retry: 2000\n\n"
+            opened_at = time.time()
+            while time.time() - opened_at < TASK_STREAM_LIFETIME:
+                events = subscriber.take(TASK_STREAM_KEEPALIVE)
+                if not events:
+                    yield ": keepalive\n\n"
+                for event in events:
+                    yield event['data']
+        finally:
+            task_feed.unsubscribe(subscriber)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 from app.models import Settings
 
@@ -291,8 +381,24 @@ def settings():
     local_scan_path_xhamster = Settings.query.filter_by(key='local_scan_path_xhamster').first()
     local_scan_path_x = Settings.query.filter_by(key='local_scan_path_x').first()
     local_check_existing = Settings.query.filter_by(key='local_check_existing').first()
+    local_watch = Settings.query.filter_by(key='local_watch').first()
     yt_dlp_auto_update = Settings.query.filter_by(key='yt_dlp_auto_update').first()
     yt_dlp_last_updated = Settings.query.filter_by(key='yt_dlp_last_updated').first()
+
+    from app.tasks import get_pool_size_settings
+    pool_sizes = get_pool_size_settings()
+    from app.tasks import get_site_scan_limits
+    scan_site_limits = get_site_scan_limits()
+    from app.services import get_scan_interval_bounds
+    scan_interval_min, scan_interval_max = get_scan_interval_bounds()
+    from app.services import get_deep_scan_interval, get_scan_stats
+    deep_scan_interval = get_deep_scan_interval()
+    scan_stats = get_scan_stats()
+    from app.http_cache import cache as http_cache
+    http_cache_stats = http_cache.get_stats()
+    from app.library_watcher import WATCH_MODE
+    from app.stash_mirror import get_mirror_status
+    stash_mirror = get_mirror_status()
     
     # Get yt-dlp version
     import subprocess
@@ -302,14 +408,15 @@ def settings():
         ytdlp_version = "Unknown"
 
     # Get next scheduled scan time
-    from app.scheduler import scheduler
+    from app.scheduler import get_next_scan_time
     next_scan_time = None
-    try:
-        job = scheduler.get_job('scheduled_scan')
-        if job and job.next_run_time:
-            next_scan_time = job.next_run_time.strftime('%Y-%m-%d %H:%M:%S')
-    except Exception:
-        pass
+    next_at = get_next_scan_time()
+    if next_at:
+        next_scan_time = next_at.replace(tzinfo=timezone.utc).astimezone().strftime('%Y-%m-%d %H:%M:%S')
+    # Jobs only live in the leader process; from any other worker just say who runs them
+    from app.leader import get_lease_holder
+    from app.scheduler import LEADER_LEASE, is_leader
+    scheduler_leader = None if is_leader() else get_lease_holder(LEADER_LEASE)
 
     cookies_exist = os.path.exists('cookies.txt')
 
@@ -322,6 +429,7 @@ def settings():
                            stash_api_key=stash_api_key.value if stash_api_key else '',
                            stash_path_mapping=stash_path_mapping.value if stash_path_mapping else '',
                            stash_check_existing=stash_check_existing.value if stash_check_existing else 'true',
+                           stash_mirror=stash_mirror,
                            schedule_interval=schedule_interval.value if schedule_interval else '60',
 
                            local_scan_path=local_scan_path.value if local_scan_path else '',
@@ -329,10 +437,20 @@ def settings():
                            local_scan_path_xhamster=local_scan_path_xhamster.value if local_scan_path_xhamster else '',
                            local_scan_path_x=local_scan_path_x.value if local_scan_path_x else '',
                            local_check_existing=local_check_existing.value if local_check_existing else 'true',
+                           local_watch=local_watch.value if local_watch else 'false',
+                           local_watch_mode=WATCH_MODE,
                            yt_dlp_auto_update=yt_dlp_auto_update.value if yt_dlp_auto_update else 'false',
                            yt_dlp_version=ytdlp_version,
                            yt_dlp_last_updated=yt_dlp_last_updated.value if yt_dlp_last_updated else 'Never',
                            next_scan_time=next_scan_time,
+                           scheduler_leader=scheduler_leader,
+                           pool_sizes=pool_sizes,
+                           scan_site_limits=scan_site_limits,
+                           scan_interval_min=scan_interval_min,
+                           scan_interval_max=scan_interval_max,
+                           deep_scan_interval=deep_scan_interval,
+                           scan_stats=scan_stats,
+                           http_cache_stats=http_cache_stats,
                            cookies_exist=cookies_exist)
 
 @main.route('/settings/logs')
@@ -362,7 +480,7 @@ def clear_logs():
 
 @main.route('/settings/<key>', methods=['POST'])
 def update_settings(key):
-    if key not in ['blacklist', 'whitelist', 'telegram', 'stash', 'schedule', 'localpath', 'autoupdate']:
+    if key not in ['blacklist', 'whitelist', 'telegram', 'stash', 'schedule', 'localpath', 'autoupdate', 'workers']:
         return "Invalid setting", 400
     
     if key == 'telegram':
@@ -402,14 +520,29 @@ def update_settings(key):
         s_interval = Settings.query.filter_by(key='schedule_interval').first() or Settings(key='schedule_interval')
         s_interval.value = interval
         db.session.add(s_interval)
-        
-        # Update Scheduler Job
-        from app.scheduler import scheduler, scheduled_scan
+
+        # Parallel scans per site (the total is the scan pool size)
+        for limit_key in ['scan_limit_pornhub', 'scan_limit_xhamster', 'scan_limit_x',
+                          'scan_interval_min', 'scan_interval_max']:
+            value = request.form.get(limit_key)
+            if value is None:
+                continue
+            s_limit = Settings.query.filter_by(key=limit_key).first() or Settings(key=limit_key)
+            s_limit.value = value if value.isdigit() and int(value) > 0 else None
+            db.session.add(s_limit)
+
+        # Deep scan cadence in hours (0 = deep scans only on demand)
+        deep_interval = request.form.get('deep_scan_interval')
+        if deep_interval is not None:
+            s_deep = Settings.query.filter_by(key='deep_scan_interval').first() or Settings(key='deep_scan_interval')
+            s_deep.value = deep_interval if deep_interval.isdigit() else None
+            db.session.add(s_deep)
+        
+        # Update Scheduler Job (only registered if this worker is the scheduler
+        # leader; otherwise the leader picks the change up on its next heartbeat)
+        from app.scheduler import sync_scheduled_jobs
         try:
-            if int(interval) > 0:
-                scheduler.add_job(id='scheduled_scan', func=scheduled_scan, trigger='interval', minutes=int(interval), replace_existing=True)
-            else:
-                scheduler.remove_job('scheduled_scan')
+            sync_scheduled_jobs()
         except Exception as e:
             print(f"Error updating scheduler: {e}")
             
@@ -439,6 +572,11 @@ def update_settings(key):
         l_check = Settings.query.filter_by(key='local_check_existing').first() or Settings(key='local_check_existing')
         l_check.value = check_existing
         db.session.add(l_check)
+
+        l_watch = Settings.query.filter_by(key='local_watch').first() or Settings(key='local_watch')
+        l_watch.value = 'true' if request.form.get('local_watch') else 'false'
+        db.session.add(l_watch)
+        # The scheduler leader starts/stops its watcher on its next heartbeat
         
     elif key == 'autoupdate':
         enabled = 'true' if request.form.get('yt_dlp_auto_update') == 'on' else 'false'
@@ -446,17 +584,31 @@ def update_settings(key):
         s_auto.value = enabled
         db.session.add(s_auto)
         
-        # Update Scheduler for Auto Update
-        from app.scheduler import scheduler, auto_update_ytdlp
+        # Update Scheduler for Auto Update (runs once a day on the scheduler leader)
+        from app.scheduler import sync_scheduled_jobs
         try:
-            if enabled == 'true':
-                # Run once a day
-                scheduler.add_job(id='auto_update_ytdlp', func=auto_update_ytdlp, trigger='interval', hours=24, replace_existing=True)
-            else:
-                scheduler.remove_job('auto_update_ytdlp')
+            sync_scheduled_jobs()
         except Exception as e:
             print(f"Error updating scheduler for auto-update: {e}")
 
+    elif key == 'workers':
+        from app.tasks import DEFAULT_POOL_SIZES, MAX_POOL_SIZE, configure_pools
+        sizes = {}
+        for name, default in DEFAULT_POOL_SIZES.items():
+            try:
+                size = int(request.form.get(f'pool_size_{name}', default))
+            except ValueError:
+                size = default
+            size = max(1, min(size, MAX_POOL_SIZE))
+            sizes[name] = size
+
+            s_size = Settings.query.filter_by(key=f'pool_size_{name}').first() or Settings(key=f'pool_size_{name}')
+            s_size.value = str(size)
+            db.session.add(s_size)
+
+        # Apply immediately in this worker; the others pick it up on their next task
+        configure_pools(sizes)
+
     else:
         value = request.form.get(key)
         setting = Settings.query.filter_by(key=key).first() or Settings(key=key)
@@ -464,6 +616,14 @@ def update_settings(key):
         db.session.add(setting)
     
     db.session.commit()
+    if key == 'stash':
+        # Apply immediately in this worker; the others re-read within STASH_CONFIG_REFRESH
+        from app.stash import invalidate_stash_config
+        invalidate_stash_config()
+    elif key == 'schedule':
+        # Site scan limits take effect in this worker now; the others pick them up on their next task
+        from app.tasks import configure_pools
+        configure_pools()
     return "<div class='alert alert-success mt-3 mb-0'>Settings saved!</div>"
 
 @main.route('/settings/update-ytdlp', methods=['POST'])
@@ -510,6 +670,14 @@ def test_stash():
     else:
         return f"<div class='alert alert-danger mt-3 mb-0'>Error: {message}</div>"
 
+@main.route('/settings/stash/resync', methods=['POST'])
+def resync_stash_mirror():
+    from app.tasks import start_task, PRIORITY_INTERACTIVE
+    from app.stash_mirror import sync_stash_mirror_task
+    start_task(sync_stash_mirror_task, full=True, pool='scan', priority=PRIORITY_INTERACTIVE,
+               dedupe_key='stash_mirror_sync')
+    return "<div class='alert alert-info mt-3 mb-0'>Full Stash mirror resync started.</div>"
+
 @main.route('/settings/export', methods=['GET'])
 def export_performers():
     import json
@@ -680,8 +848,8 @@ def dashboard():
 
 @main.route('/api/dashboard/stats')
 def dashboard_stats():
-    from app.tasks import tasks
-    from app.scheduler import scheduler
+    from app.tasks import get_active_tasks, get_recent_tasks, get_pool_stats
+    from app.scheduler import get_next_scan_time
     
     # Stats
     total_performers = Performer.query.count()
@@ -692,11 +860,11 @@ def dashboard_stats():
     next_scan = None
     next_scan_relative = None
     try:
-        job = scheduler.get_job('scheduled_scan')
-        if job and job.next_run_time:
-            next_scan = job.next_run_time.strftime('%Y-%m-%d %H:%M:%S')
+        next_at = get_next_scan_time()
+        if next_at:
+            next_scan = next_at.replace(tzinfo=timezone.utc).astimezone().strftime('%Y-%m-%d %H:%M:%S')
             # Calculate relative time (e.g. "in 20 minutes")
-            diff = job.next_run_time - datetime.now(job.next_run_time.tzinfo)
+            diff = next_at - datetime.utcnow()
             minutes = int(diff.total_seconds() / 60)
             if minutes < 0:
                 next_scan_relative = "Due now"
@@ -712,19 +880,9 @@ def dashboard_stats():
     except Exception:
         pass
         
-    # Tasks
-    active_tasks = {k: v for k, v in tasks.items() if v['status'] in ['pending', 'running']}
-    
-    # Recent tasks (completed/failed), limit to last 5
-    # Since dict is unordered in older python but ordered in newer, we can just take items.
-    # Ideally we'd have timestamps, but for now let's just take non-active ones.
-    finished_tasks = {k: v for k, v in tasks.items() if v['status'] in ['completed', 'failed']}
-    # Sort by something? We don't have timestamps in task dict. 
-    # Let's just take the last 5 items (assuming insertion order is roughly chronological)
-    recent_tasks = dict(list(finished_tasks.items())[-5:])
-    
-    # Reverse to show newest first
-    recent_tasks = dict(reversed(list(recent_tasks.items())))
+    # Tasks (shared across workers via the task table)
+    active_tasks = get_active_tasks()
+    recent_tasks = get_recent_tasks(limit=5)
 
     return render_template('components/dashboard_stats.html',
                            total_performers=total_performers,
@@ -733,4 +891,5 @@ def dashboard_stats():
                            next_scan=next_scan,
                            next_scan_relative=next_scan_relative,
                            active_tasks=active_tasks,
-                           recent_tasks=recent_tasks)
+                           recent_tasks=recent_tasks,
+                           pool_stats=get_pool_stats())
@@ -2,56 +2,145 @@ from flask_apscheduler import APScheduler
 from app.models import Settings, Performer
 from app.scraper import scrape_performer
 from app.routes import db # Need app context
+from datetime import datetime
+from sqlalchemy import or_
 
 scheduler = APScheduler()
 
+# Every process runs APScheduler, but only the holder of the 'scheduler' lease
+# registers the scan/update jobs and runs the library watcher (if enabled). The
+# heartbeat renews the lease; if the leader dies its lease expires and another
+# process picks the jobs up.
+LEADER_LEASE = 'scheduler'
+LEADER_LEASE_TTL = 90 # seconds
+LEADER_HEARTBEAT_INTERVAL = 30 # seconds, well inside the TTL
+LEADER_JOB_IDS = ['scheduled_scan', 'auto_update_ytdlp', 'stash_mirror_sync']
+
+_is_leader = False
+_lease_valid_until = None # Last successful renewal + TTL, for riding out a locked database
+
+def scan_performer_task(task_id, performer_id):
+    """start_task entry point for one performer of a scheduled scan; also triggers its auto-downloads.
+
+    Returns the performer's summary for the batch's Telegram message.
+    """
+    from app.services import scan_performer_service
+    from app.tasks import start_task, task_app_context, task_kwargs, PRIORITY_SCHEDULED
+    from app.downloader import download_video
+
+    with task_app_context():
+        performer = Performer.query.get(performer_id)
+        if not performer:
+            return None
+        summary = {'name': performer.name, 'new_count': 0, 'auto_downloads': 0, 'error': None}
+
+        def start_downloads(video_ids):
+            # Called per listing page, so downloads start while the scan is still paginating
+            if not performer.auto_download:
+                return
+            print(f"Triggering auto-download for {performer.name} ({len(video_ids)} videos)...")
+            for vid_id in video_ids:
+                start_task(download_video, vid_id, trigger_autotag=True, pool='download',
+                           priority=PRIORITY_SCHEDULED, group=performer.id,
+                           dedupe_key=f'download:{vid_id}', resumable=True)
+                summary['auto_downloads'] += 1
+
+        # A manual deep scan may have been deduped onto this one while it was queued
+        mode = task_kwargs(task_id).get('mode')
+        result = scan_performer_service(performer, task_id, mode=mode, on_new_videos=start_downloads)
+        summary['new_count'] = result['new_count']
+        return summary
+
+def format_scan_summary(summaries):
+    """Merges per-performer scan results into one Telegram message (or None if nothing to report)."""
+    total_new = sum(s['new_count'] for s in summaries)
+    auto_download_count = sum(s['auto_downloads'] for s in summaries)
+    errors = [s for s in summaries if s['error']]
+    if total_new == 0 and not errors:
+        return None
+
+    msg = f"<b>Scheduled Scan Completed</b>\nFound {total_new} new videos."
+    for s in sorted((s for s in summaries if s['new_count']), key=lambda s: -s['new_count']):
+        msg += f"\n• {s['name']}: {s['new_count']} new"
+    if auto_download_count > 0:
+        msg += f"\nStarted {auto_download_count} automatic downloads."
+    if errors:
+        msg += f"\n{len(errors)} performer(s) failed: {', '.join(s['name'] for s in errors)}"
+    return msg
+
+def send_scan_summary(task_names, started):
+    """Batch callback of a scheduled scan: logs it and sends the Telegram summary."""
+    import time
+    from app.models import Task
+
+    tasks = {t.id: t.to_dict() for t in Task.query.filter(Task.id.in_(list(task_names))).all()}
+    summaries = []
+    for task_id, name in task_names.items():
+        task = tasks.get(task_id)
+        if task and task['status'] == 'completed' and isinstance(task['result'], dict):
+            summaries.append(task['result'])
+        elif task and task['status'] == 'failed':
+            summaries.append({'name': name, 'new_count': 0, 'auto_downloads': 0, 'error': task['message']})
+    print(f"Scheduled scan finished: {len(summaries)} performers in {time.time() - started:.1f}s.")
+
+    msg = format_scan_summary(summaries)
+    if msg:
+        from app.notifications import send_telegram_message
+        send_telegram_message(msg)
+
 def scheduled_scan():
-    with scheduler.app.app_context():
+    """Queues a scan of every due performer on the scan pool and returns.
+
+    The pool applies the per-site limits and its own size as the overall
+    cap; manual scans share the same lane. A Batch sends the summary once
+    the last scan has finished.
+    """
+    import time
+    from app.tasks import start_task, Batch, PRIORITY_SCHEDULED
+
+    if not _is_leader:
+        # A job registered before leadership moved; the next heartbeat removes it
+        return
+
+    app = scheduler.app
+    with app.app_context():
         print("Starting scheduled scan...")
-        from app.services import scan_performer_service
-        
-        performers = Performer.query.filter_by(scheduled_scan_enabled=True).all()
-        total_new = 0
-        auto_download_count = 0
-        
-        from app.tasks import start_task
-        from app.downloader import download_video
         
+        # Only performers whose adaptive interval has elapsed; never-scanned
+        # performers (no next_scan_at yet) go first.
+        now = datetime.utcnow()
+        performers = (Performer.query.filter_by(scheduled_scan_enabled=True)
+                      .filter(or_(Performer.next_scan_at.is_(None), Performer.next_scan_at <= now))
+                      .order_by(Performer.next_scan_at.is_(None).desc(), Performer.next_scan_at)
+                      .all())
+        if not performers:
+            print("Scheduled scan: no performers due.")
+            return
+
+        task_names = {}
+        started = time.time()
+        batch = Batch(lambda: send_scan_summary(task_names, started))
         for performer in performers:
-            try:
-                result = scan_performer_service(performer)
-                total_new += result['new_count']
-                
-                # Trigger Auto-Download
-                if performer.auto_download and result.get('new_video_ids'):
-                    print(f"Triggering auto-download for {performer.name} ({len(result['new_video_ids'])} videos)...")
-                    for vid_id in result['new_video_ids']:
-                        # Double check status to be safe (though service should filter)
-                        # We can't easily check DB here without re-querying, but the ID is fresh.
-                        # Just fire the task.
-                        start_task(download_video, vid_id, trigger_autotag=True)
-                        auto_download_count += 1
-                        
-            except Exception as e:
-                print(f"Error scanning {performer.name}: {e}")
-        
-        if total_new > 0:
-            from app.notifications import send_telegram_message
-            msg = f"<b>Scheduled Scan Completed</b>\nFound {total_new} new videos."
-            if auto_download_count > 0:
-                msg += f"\nStarted {auto_download_count} automatic downloads."
-            send_telegram_message(msg)
+            task_id = start_task(scan_performer_task, performer.id, pool='scan', batch=batch,
+                                 priority=PRIORITY_SCHEDULED, group=performer.id, site=performer.site,
+                                 dedupe_key=f'scan:{performer.id}')
+            if task_id in batch.task_ids:
+                task_names[task_id] = performer.name
+            else:
+                # Already being scanned (e.g. a manual scan); it isn't part of this batch
+                print(f"Skipping {performer.name}: scan already in progress.")
+        print(f"Scheduled scan: queued {len(task_names)} performers.")
+        batch.seal()
 
 def auto_update_ytdlp():
+    if not _is_leader:
+        return
     import subprocess
     from datetime import datetime
-    from app import create_app, db
-    from app.models import Settings
-    
+    from app import db
     from app.models import Settings
     
-    app = create_app(with_scheduler=False)
-    with app.app_context():
+    with scheduler.app.app_context():
         try:
             print("Starting auto-update of yt-dlp...")
             # Update and sync in one go
@@ -66,7 +155,137 @@ def auto_update_ytdlp():
         except Exception as e:
             print(f"Error auto-updating yt-dlp: {e}")
 
+def sync_stash_mirror_job():
+    if not _is_leader:
+        return
+    from app.stash_mirror import sync_stash_mirror
+
+    with scheduler.app.app_context():
+        try:
+            sync_stash_mirror()
+        except Exception as e:
+            print(f"Error syncing Stash mirror: {e}")
+
+def is_leader():
+    return _is_leader
+
+def get_schedule_interval():
+    """Minutes between scheduled scan runs (0 = off)."""
+    interval_setting = Settings.query.filter_by(key='schedule_interval').first()
+    return int(interval_setting.value) if interval_setting and interval_setting.value.isdigit() else 60
+
+def get_next_scan_time():
+    """When the next performer falls due for a scheduled scan (naive UTC), or None.
+
+    Read from the database rather than the scan job, which only exists in the
+    leader process. A due performer is picked up on the job's next run.
+    """
+    from sqlalchemy import func
+    if get_schedule_interval() <= 0:
+        return None
+    enabled = Performer.query.filter_by(scheduled_scan_enabled=True)
+    if enabled.filter(Performer.next_scan_at.is_(None)).first():
+        return datetime.utcnow() # Never scanned: due on the next run
+    return (db.session.query(func.min(Performer.next_scan_at))
+            .filter(Performer.scheduled_scan_enabled.is_(True)).scalar())
+
+def _set_interval_job(job_id, func, interval):
+    """Adds or removes an interval job. Leaves a job with an unchanged interval alone so
+    re-syncing on every heartbeat doesn't keep pushing its next run time back."""
+    job = scheduler.get_job(job_id)
+    if not interval:
+        if job:
+            scheduler.remove_job(job_id)
+        return
+    if job and getattr(job.trigger, 'interval', None) == interval:
+        return
+    scheduler.add_job(id=job_id, func=func, trigger='interval', seconds=int(interval.total_seconds()), replace_existing=True)
+
+def sync_scheduled_jobs():
+    """Registers the leader-only jobs from Settings, or drops them if this process isn't the leader.
+
+    Runs on every heartbeat, so a settings change saved through any worker
+    reaches the leader within LEADER_HEARTBEAT_INTERVAL.
+    """
+    from datetime import timedelta
+    if not _is_leader:
+        for job_id in LEADER_JOB_IDS:
+            if scheduler.get_job(job_id):
+                scheduler.remove_job(job_id)
+        return
+
+    interval = get_schedule_interval()
+    _set_interval_job('scheduled_scan', scheduled_scan, timedelta(minutes=interval) if interval > 0 else None)
+
+    auto_update = Settings.query.filter_by(key='yt_dlp_auto_update').first()
+    enabled = auto_update is not None and auto_update.value == 'true'
+    _set_interval_job('auto_update_ytdlp', auto_update_ytdlp, timedelta(hours=24) if enabled else None)
+
+    from app.stash_mirror import STASH_MIRROR_SYNC_MINUTES
+    stash_url = Settings.query.filter_by(key='stash_url').first()
+    stash_configured = stash_url is not None and bool(stash_url.value)
+    _set_interval_job('stash_mirror_sync', sync_stash_mirror_job,
+                      timedelta(minutes=STASH_MIRROR_SYNC_MINUTES) if stash_configured else None)
+
+def leader_heartbeat():
+    """Takes or renews the scheduler lease and (un)registers the leader-only jobs."""
+    global _is_leader, _lease_valid_until
+    from app.leader import acquire_lease
+    from app.tasks import PROCESS_ID
+    from datetime import timedelta
+
+    app = scheduler.app
+    with app.app_context():
+        now = datetime.utcnow()
+        try:
+            holding = acquire_lease(LEADER_LEASE, PROCESS_ID, LEADER_LEASE_TTL)
+            if holding:
+                _lease_valid_until = now + timedelta(seconds=LEADER_LEASE_TTL)
+        except Exception as e:
+            # Database busy: keep our role until the lease we last renewed runs out
+            print(f"Error renewing scheduler lease: {e}")
+            holding = _is_leader and _lease_valid_until is not None and now < _lease_valid_until
+
+        if holding != _is_leader:
+            print(f"Scheduler leadership {'acquired' if holding else 'lost'} by {PROCESS_ID}.")
+        _is_leader = holding
+
+        try:
+            sync_scheduled_jobs()
+        except Exception as e:
+            print(f"Error syncing scheduler jobs: {e}")
+
+        try:
+            from app.library_watcher import sync_library_watcher
+            sync_library_watcher(app, holding)
+        except Exception as e:
+            print(f"Error syncing library watcher: {e}")
+
+        if holding:
+            # The leader hands on work of workers that died (or of the last
+            # restart, see `flask tasks recover`) and re-queues what can resume
+            try:
+                from app.tasks import recover_dead_owners, resume_orphaned_tasks
+                recover_dead_owners()
+                resume_orphaned_tasks()
+            except Exception as e:
+                print(f"Error resuming tasks: {e}")
+
+def _release_leadership(app):
+    if not _is_leader:
+        return
+    from app.leader import release_lease
+    from app.tasks import PROCESS_ID
+    try:
+        with app.app_context():
+            release_lease(LEADER_LEASE, PROCESS_ID)
+    except Exception:
+        pass
+
 def init_scheduler(app):
+    import atexit
+    import os
+
     # Default config
     app.config['SCHEDULER_API_ENABLED'] = True
     
@@ -74,20 +293,14 @@ def init_scheduler(app):
     
     if not scheduler.running:
         scheduler.start()
-    
-    # Add job based on saved settings
-    with app.app_context():
-        try:
-            interval_setting = Settings.query.filter_by(key='schedule_interval').first()
-            interval = int(interval_setting.value) if interval_setting and interval_setting.value.isdigit() else 60
-            
-            if interval > 0:
-                scheduler.add_job(id='scheduled_scan', func=scheduled_scan, trigger='interval', minutes=interval, replace_existing=True)
-            else:
-                # Ensure job is removed if interval is 0 (in case of persistent job store)
-                try:
-                    scheduler.remove_job('scheduled_scan')
-                except Exception:
-                    pass
-        except Exception as e:
-            print(f"Error initializing scheduler job: {e}")
+
+    # SIPHON_SCHEDULER=off keeps a process out of the election (e.g. web-only workers)
+    if os.environ.get('SIPHON_SCHEDULER', 'on').lower() in ('0', 'off', 'false'):
+        return
+
+    scheduler.add_job(id='leader_heartbeat', func=leader_heartbeat, trigger='interval',
+                      seconds=LEADER_HEARTBEAT_INTERVAL, replace_existing=True)
+    # First attempt right away so a single-process install starts scanning without a delay
+    leader_heartbeat()
+    # Hand over quickly on clean shutdown instead of waiting for the TTL
+    atexit.register(_release_leadership, app)
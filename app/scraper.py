@@ -1,9 +1,11 @@
 import yt_dlp
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.builder import builder_registry
 from urllib.parse import urlparse, parse_qs
-import time
+from datetime import datetime
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
@@ -13,182 +15,257 @@ YDL_OPTS = {
     'quiet': True,
 }
 
-HEADERS = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-}
-
+from app.fetcher import PagePrefetcher, PREFETCH_PAGES
 from app.tasks import update_task_progress
 
-def scrape_xhamster_videos(performer_id, performer_type, task_id=None, use_cookies=False):
+# Scan modes. Listings are newest-first, so a shallow scan is incremental: it
+# pages forward only until it reaches videos we already have. A deep scan is a
+# full resync that walks the whole history to pick up anything older that was missed.
+SCAN_MODE_SHALLOW = 'shallow'
+SCAN_MODE_DEEP = 'deep'
+KNOWN_PAGES_TO_STOP = 1 # Consecutive fully-known pages (scroll rounds on X) that end an incremental scan
+SHALLOW_SCAN_PAGES = 5 # Upper bound for a shallow scan; it normally stops after one or two
+SHALLOW_SCAN_SCROLLS = 5 # Same bound for scroll rounds on X
+PORNHUB_MAX_PAGES = 21 # Safety limit for a full pornhub listing
+
+# Overridable so scans can be pointed at a local stand-in (scripts/fake_site.py)
+PORNHUB_BASE_URL = os.environ.get('PORNHUB_BASE_URL', 'https://www.pornhub.com').rstrip('/')
+XHAMSTER_BASE_URL = os.environ.get('XHAMSTER_BASE_URL', 'https://xhamster.com').rstrip('/')
+
+class ListingUnchanged(Exception):
+    """Page 1 of a listing is byte-identical to what the last completed scan saw."""
+
+def _is_known_page(page_viewkeys, known_viewkeys):
+    return bool(page_viewkeys) and page_viewkeys <= known_viewkeys
+
+def _check_unchanged(response, skip_unchanged_since):
+    """Raises ListingUnchanged if page 1 came back identical and a scan has completed since that body was first seen."""
+    if not skip_unchanged_since or not getattr(response, 'unchanged', False) or not response.cached_at:
+        return
+    if datetime.fromisoformat(response.cached_at) <= skip_unchanged_since:
+        raise ListingUnchanged()
+
+# Listing pages are hundreds of KB but we only need the thumbnail grid. Parse
+# just that container (lxml if installed) and fall back to a full html.parser
+# parse with the original selectors if the narrow pass finds nothing.
+# Ask bs4 rather than importing lxml: a half-installed lxml imports fine but has no tree builder
+HTML_PARSER = 'lxml' if builder_registry.lookup('lxml') else 'html.parser'
+
+def _has_class(name):
+    # While parsing, a strainer sees class as the raw attribute string ("a b"),
+    # so a plain class_='a' only matches elements with no other class
+    return lambda value: bool(value) and name in value.split()
+
+# Both Pornhub layouts (ul#videoCategory, .videoUList) are ul.videos
+PORNHUB_LISTING = SoupStrainer('ul', class_=_has_class('videos'))
+XHAMSTER_LISTING = SoupStrainer('div', class_=_has_class('thumb-list__item'))
+
+def parse_xhamster_listing(html):
+    """Returns [{'title', 'viewkey', 'url', 'duration'}] for an xHamster listing page."""
+    soup = BeautifulSoup(html, HTML_PARSER, parse_only=XHAMSTER_LISTING)
+    link_tags = soup.select('div.thumb-list__item a.video-thumb-info__name')
+    if not link_tags:
+        soup = BeautifulSoup(html, 'html.parser')
+        link_tags = soup.select('div.thumb-list__item a.video-thumb-info__name')
+
+    videos = []
+    for link in link_tags:
+        url = link.get('href')
+        title = link.text.strip()
+
+        # Try to find duration
+        duration = None
+        parent_div = link.find_parent('div', class_='thumb-list__item')
+        if parent_div:
+            duration_tag = parent_div.select_one('.thumb-image-container__duration')
+            if duration_tag:
+                duration = duration_tag.text.strip()
+
+        if url and title:
+            try:
+                slug_with_key = url.split('/')[-1]
+                _, viewkey = slug_with_key.rsplit('-', 1)
+                videos.append({'title': title, 'viewkey': viewkey, 'url': url, 'duration': duration})
+            except ValueError:
+                continue
+    return videos
+
+def parse_pornhub_listing(html):
+    """Returns [{'title', 'viewkey', 'url', 'duration'}] for a Pornhub listing page."""
+    def select_items(soup):
+        # Try multiple selectors as PH layout varies
+        return soup.select('ul#videoCategory li.videoBox') or soup.select('.videoUList .videoBox')
+
+    video_items = select_items(BeautifulSoup(html, HTML_PARSER, parse_only=PORNHUB_LISTING))
+    if not video_items:
+        video_items = select_items(BeautifulSoup(html, 'html.parser'))
+
+    videos = []
+    for item in video_items:
+        title_tag = item.select_one('.title a')
+        if not title_tag: continue
+
+        title = title_tag.text.strip()
+        url = PORNHUB_BASE_URL + title_tag.get('href')
+
+        # Extract viewkey
+        parsed_url = urlparse(url)
+        query_params = parse_qs(parsed_url.query)
+        viewkey = query_params.get('viewkey', [None])[0]
+
+        if not viewkey:
+            continue
+
+        # Extract duration
+        duration = None
+        duration_tag = item.select_one('.duration')
+        if duration_tag:
+            duration = duration_tag.text.strip()
+
+        videos.append({'title': title, 'viewkey': viewkey, 'url': url, 'duration': duration})
+    return videos
+
+def iter_xhamster_pages(performer_id, performer_type, task_id=None, use_cookies=False, max_pages=None,
+                        known_viewkeys=None, stop_after_known_pages=KNOWN_PAGES_TO_STOP, skip_unchanged_since=None):
     """
-    Scrapes videos for xHamster performers.
+    Scrapes videos for xHamster performers, yielding each listing page's videos as a list.
+    Stops after max_pages listing pages if given. With known_viewkeys, also stops
+    after stop_after_known_pages consecutive pages with nothing new (None = full resync).
+    Raises ListingUnchanged if page 1 is identical to the copy cached before
+    skip_unchanged_since (the last completed scan).
     """
     if performer_type == 'creator':
-        base_url = f"https://xhamster.com/creators/{performer_id}/newest"
+        base_url = f"{XHAMSTER_BASE_URL}/creators/{performer_id}/newest"
     elif performer_type == 'pornstar':
-        base_url = f"https://xhamster.com/pornstars/{performer_id}/exclusive"
+        base_url = f"{XHAMSTER_BASE_URL}/pornstars/{performer_id}/exclusive"
     else:
         logger.warning(f"Unknown xhamster performer type: {performer_type}")
-        return []
+        return
+
+    def page_url(n):
+        return base_url if n == 1 else f"{base_url}/{n}"
 
-    all_found_videos = []
     page_number = 1
+    known_pages = 0
+    # Incremental scans usually stop after a page or two, so only full scans read ahead
+    pages = PagePrefetcher(page_url, use_cookies=use_cookies, prefetch=0 if known_viewkeys is not None else PREFETCH_PAGES,
+                           last_page=max_pages, cache_first_page=skip_unchanged_since is not None)
 
-    while True:
-        if task_id:
-            update_task_progress(task_id, message=f"Scanning page {page_number}...")
+    try:
+        while True:
+            if task_id:
+                update_task_progress(task_id, message=f"Scanning page {page_number}...")
             
-        if page_number == 1:
-            current_url = base_url
-        else:
-            current_url = f"{base_url}/{page_number}"
-
-        logger.info(f"Scraping xhamster page: {current_url}")
+            current_url = page_url(page_number)
+            logger.info(f"Scraping xhamster page: {current_url}")
         
-        try:
-            cookies = {}
-            if use_cookies:
-                import http.cookiejar
-                import os
-                if os.path.exists('cookies.txt'):
-                    try:
-                        cj = http.cookiejar.MozillaCookieJar('cookies.txt')
-                        cj.load()
-                        # Convert to dict for requests
-                        cookies = {cookie.name: cookie.value for cookie in cj}
-                        logger.info("Loaded cookies from cookies.txt for xHamster scraping")
-                    except Exception as e:
-                        logger.error(f"Error loading cookies: {e}")
-
-            response = requests.get(current_url, headers=HEADERS, cookies=cookies, timeout=15)
-            if response.status_code == 404:
-                break
-            response.raise_for_status()
+            try:
+                # Rate-limited per host; the next pages may already be in flight
+                response = pages.get(page_number)
+                if response.status_code == 404:
+                    break
+                response.raise_for_status()
+                if page_number == 1:
+                    _check_unchanged(response, skip_unchanged_since)
 
-            soup = BeautifulSoup(response.text, 'html.parser')
-            link_tags = soup.select('div.thumb-list__item a.video-thumb-info__name')
-
-            if not link_tags:
-                break
+                page_videos = parse_xhamster_listing(response.text)
+                if not page_videos:
+                    break
             
-            for link in link_tags:
-                url = link.get('href')
-                title = link.text.strip() 
-                
-                # Try to find duration
-                duration = None
-                parent_div = link.find_parent('div', class_='thumb-list__item')
-                if parent_div:
-                    duration_tag = parent_div.select_one('.thumb-image-container__duration')
-                    if duration_tag:
-                        duration = duration_tag.text.strip()
-
-                if url and title:
-                    try:
-                        slug_with_key = url.split('/')[-1]
-                        _, viewkey = slug_with_key.rsplit('-', 1)
-                        all_found_videos.append({'title': title, 'viewkey': viewkey, 'url': url, 'duration': duration})
-                    except ValueError:
-                        continue
-            
-            page_number += 1
-            time.sleep(1)
+                # Hand each page to the caller as soon as it is parsed
+                yield page_videos
 
-        except requests.exceptions.RequestException as e:
-            logger.error(f"An error occurred during request: {e}")
-            break
+                if known_viewkeys is not None:
+                    page_viewkeys = {v['viewkey'] for v in page_videos}
+                    known_pages = known_pages + 1 if _is_known_page(page_viewkeys, known_viewkeys) else 0
+                    if known_pages >= stop_after_known_pages:
+                        logger.info(f"Reached known videos on page {page_number}; stopping.")
+                        break
+                if max_pages and page_number >= max_pages:
+                    break
             
-    return all_found_videos
+                page_number += 1
+
+            except requests.exceptions.RequestException as e:
+                logger.error(f"An error occurred during request: {e}")
+                break
+    finally:
+        # Also runs when the caller stops iterating early
+        pages.close()
 
-def scrape_pornhub_videos(performer_id, performer_type, task_id=None, use_cookies=False):
+def iter_pornhub_pages(performer_id, performer_type, task_id=None, use_cookies=False, max_pages=None,
+                       known_viewkeys=None, stop_after_known_pages=KNOWN_PAGES_TO_STOP, skip_unchanged_since=None):
     """
-    Scrapes videos for Pornhub performers using BeautifulSoup (better for duration/metadata).
+    Scrapes videos for Pornhub performers using BeautifulSoup (better for duration/metadata),
+    yielding each listing page's videos as a list.
+    Stops after max_pages listing pages if given. With known_viewkeys, also stops
+    after stop_after_known_pages consecutive pages with nothing new (None = full resync).
+    Raises ListingUnchanged if page 1 is identical to the copy cached before
+    skip_unchanged_since (the last completed scan).
     """
     if performer_type == 'model':
-        base_url = f"https://www.pornhub.com/model/{performer_id}/videos"
+        base_url = f"{PORNHUB_BASE_URL}/model/{performer_id}/videos"
     elif performer_type == 'pornstar':
-        base_url = f"https://www.pornhub.com/pornstar/{performer_id}/videos/upload"
+        base_url = f"{PORNHUB_BASE_URL}/pornstar/{performer_id}/videos/upload"
     else:
         logger.warning(f"Unknown pornhub performer type: {performer_type}")
-        return []
+        return
+
+    def page_url(n):
+        return f"{base_url}?page={n}"
 
-    videos_data = []
     page_number = 1
+    known_pages = 0
+    # Incremental scans usually stop after a page or two, so only full scans read ahead
+    pages = PagePrefetcher(page_url, use_cookies=use_cookies, prefetch=0 if known_viewkeys is not None else PREFETCH_PAGES,
+                           last_page=min(max_pages or PORNHUB_MAX_PAGES, PORNHUB_MAX_PAGES),
+                           cache_first_page=skip_unchanged_since is not None)
     
-    while True:
-        if task_id:
-            update_task_progress(task_id, message=f"Scanning page {page_number}...")
+    try:
+        while True:
+            if task_id:
+                update_task_progress(task_id, message=f"Scanning page {page_number}...")
             
-        current_url = f"{base_url}?page={page_number}"
-        logger.info(f"Scraping pornhub page: {current_url}")
+            current_url = page_url(page_number)
+            logger.info(f"Scraping pornhub page: {current_url}")
         
-        try:
-            cookies = {}
-            if use_cookies:
-                import http.cookiejar
-                import os
-                if os.path.exists('cookies.txt'):
-                    try:
-                        cj = http.cookiejar.MozillaCookieJar('cookies.txt')
-                        cj.load()
-                        # Convert to dict for requests
-                        cookies = {cookie.name: cookie.value for cookie in cj}
-                        logger.info("Loaded cookies from cookies.txt for Pornhub scraping")
-                    except Exception as e:
-                        logger.error(f"Error loading cookies: {e}")
-
-            response = requests.get(current_url, headers=HEADERS, cookies=cookies, timeout=15)
-            if response.status_code == 404:
-                break
-            response.raise_for_status()
+            try:
+                # Rate-limited per host; the next pages may already be in flight
+                response = pages.get(page_number)
+                if response.status_code == 404:
+                    break
+                response.raise_for_status()
+                if page_number == 1:
+                    _check_unchanged(response, skip_unchanged_since)
             
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Select video items
-            # Try multiple selectors as PH layout varies
-            video_items = soup.select('ul#videoCategory li.videoBox')
-            if not video_items:
-                video_items = soup.select('.videoUList .videoBox')
-                
-            if not video_items:
-                # If no videos found on page 1, maybe empty. If page > 1, stop.
-                break
+                page_videos = parse_pornhub_listing(response.text)
+                if not page_videos:
+                    # If no videos found on page 1, maybe empty. If page > 1, stop.
+                    break
                 
-            for item in video_items:
-                title_tag = item.select_one('.title a')
-                if not title_tag: continue
-                
-                title = title_tag.text.strip()
-                url = "https://www.pornhub.com" + title_tag.get('href')
-                
-                # Extract viewkey
-                parsed_url = urlparse(url)
-                query_params = parse_qs(parsed_url.query)
-                viewkey = query_params.get('viewkey', [None])[0]
-                
-                if not viewkey:
-                    continue
-                    
-                # Extract duration
-                duration = None
-                duration_tag = item.select_one('.duration')
-                if duration_tag:
-                    duration = duration_tag.text.strip()
-                
-                videos_data.append({'title': title, 'viewkey': viewkey, 'url': url, 'duration': duration})
+                # Hand each page to the caller as soon as it is parsed
+                yield page_videos
             
-            # Check for next page button to decide whether to continue
-            if page_number > 20: # Safety limit
-                break
+                # Check for next page button to decide whether to continue
+                if page_number >= PORNHUB_MAX_PAGES: # Safety limit
+                    break
+                if known_viewkeys is not None:
+                    page_viewkeys = {v['viewkey'] for v in page_videos}
+                    known_pages = known_pages + 1 if _is_known_page(page_viewkeys, known_viewkeys) else 0
+                    if known_pages >= stop_after_known_pages:
+                        logger.info(f"Reached known videos on page {page_number}; stopping.")
+                        break
+                if max_pages and page_number >= max_pages:
+                    break
                 
-            page_number += 1
-            time.sleep(1)
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"An error occurred during request: {e}")
-            break
+                page_number += 1
             
-    return videos_data
+            except requests.exceptions.RequestException as e:
+                logger.error(f"An error occurred during request: {e}")
+                break
+    finally:
+        # Also runs when the caller stops iterating early
+        pages.close()
 
 def format_duration(seconds):
     if not seconds:
@@ -262,17 +339,39 @@ def filter_videos(videos, performer):
             filtered_videos.append(video)
     return filtered_videos
 
-def scrape_performer(performer, task_id=None):
+def iter_performer_pages(performer, task_id=None, mode=SCAN_MODE_DEEP, known_viewkeys=None, skip_unchanged_since=None):
     """
-    Dispatcher function to scrape based on performer site.
+    Dispatcher: yields the performer's videos one listing page (list of dicts) at a time.
+    mode is SCAN_MODE_SHALLOW (incremental, stops at known_viewkeys) or
+    SCAN_MODE_DEEP (full resync of the whole listing). Shallow pornhub/xHamster
+    scans raise ListingUnchanged when page 1 hasn't changed since skip_unchanged_since.
+    X is scraped in one browser session, so it arrives as a single batch.
     """
-    videos = []
+    shallow = mode == SCAN_MODE_SHALLOW
+    max_pages = SHALLOW_SCAN_PAGES if shallow else None
+    if not shallow:
+        known_viewkeys = None
+        skip_unchanged_since = None
+
     if performer.site == 'xhamster':
-        videos = scrape_xhamster_videos(performer.id, performer.type, task_id, performer.use_cookies)
+        yield from iter_xhamster_pages(performer.id, performer.type, task_id, performer.use_cookies, max_pages=max_pages,
+                                       known_viewkeys=known_viewkeys, skip_unchanged_since=skip_unchanged_since)
     elif performer.site == 'pornhub':
-        videos = scrape_pornhub_videos(performer.id, performer.type, task_id, performer.use_cookies)
+        yield from iter_pornhub_pages(performer.id, performer.type, task_id, performer.use_cookies, max_pages=max_pages,
+                                      known_viewkeys=known_viewkeys, skip_unchanged_since=skip_unchanged_since)
     elif performer.site == 'x':
         from app.x_scraper import scrape_x_videos
-        videos = scrape_x_videos(performer.id, task_id, performer.use_cookies)
-    
+        videos = scrape_x_videos(performer.id, task_id, performer.use_cookies,
+                                 max_scrolls=SHALLOW_SCAN_SCROLLS if shallow else None,
+                                 known_viewkeys=known_viewkeys)
+        if videos:
+            yield videos
+
+def scrape_performer(performer, task_id=None, mode=SCAN_MODE_DEEP, **kwargs):
+    """
+    Scrapes the whole listing into one list (see iter_performer_pages for the streaming form).
+    """
+    videos = []
+    for page_videos in iter_performer_pages(performer, task_id, mode=mode, **kwargs):
+        videos.extend(page_videos)
     return videos
@@ -1,44 +1,185 @@
 from app import db
 from app.models import Video, Settings
-from app.scraper import scrape_performer, is_video_allowed
-from app.stash import check_stash_video
+from app.scraper import iter_performer_pages, is_video_allowed, ListingUnchanged, SCAN_MODE_SHALLOW, SCAN_MODE_DEEP
+from app.stash import get_stash_client
+from app.local_index import local_index, get_local_path, get_local_roots
 from app.tasks import update_task_progress
-from datetime import datetime
-import os
+from datetime import datetime, timedelta
+import itertools
+import json
+import math
+import threading
+import time
 
-def scan_performer_service(performer, task_id=None):
+# Adaptive scan scheduling. Bounds are configurable in Settings
+# (scan_interval_min / scan_interval_max, in minutes).
+DEFAULT_SCAN_INTERVAL_MIN = 60
+DEFAULT_SCAN_INTERVAL_MAX = 7 * 24 * 60
+DEFAULT_UPLOAD_GAP = timedelta(days=7) # Assumed until a performer has some upload history
+UPLOAD_HISTORY_SIZE = 20 # Most recent upload days considered
+CHECKS_PER_UPLOAD_GAP = 4 # How many times to look between two typical uploads
+
+def get_scan_interval_bounds():
+    """Returns (min_minutes, max_minutes) for adaptive scan intervals."""
+    def read_int(key, default):
+        setting = Settings.query.filter_by(key=key).first()
+        if setting and setting.value and setting.value.isdigit() and int(setting.value) > 0:
+            return int(setting.value)
+        return default
+
+    min_minutes = read_int('scan_interval_min', DEFAULT_SCAN_INTERVAL_MIN)
+    max_minutes = max(read_int('scan_interval_max', DEFAULT_SCAN_INTERVAL_MAX), min_minutes)
+    return min_minutes, max_minutes
+
+def get_upload_days(performer, limit=UPLOAD_HISTORY_SIZE):
+    """Returns the performer's most recent distinct upload days, newest first.
+
+    Uses Video.date when the site provides it, else the day the video was
+    first seen. Collapsing to days keeps the initial catalogue import (all
+    first seen at once) from looking like a burst of uploads.
+    """
+    days = set()
+    rows = (db.session.query(Video.date, Video.created_at)
+            .filter(Video.performer_id == performer.id)
+            .order_by(Video.created_at.desc()).limit(limit * 10).all())
+    for date_str, created_at in rows:
+        day = None
+        if date_str:
+            try:
+                day = datetime.strptime(date_str, '%Y-%m-%d').date()
+            except ValueError:
+                pass
+        if day is None and created_at:
+            day = created_at.date()
+        if day:
+            days.add(day)
+    return sorted(days, reverse=True)[:limit]
+
+def compute_scan_interval(performer, min_minutes=None, max_minutes=None, now=None):
+    """Returns how long to wait before scanning performer again.
+
+    A manual override wins. Otherwise the interval is a fraction of the
+    median gap between uploads, doubled for every doubling of the time since
+    the last upload beyond that gap (dormant performers back off
+    exponentially), and clamped to [min, max].
+    """
+    if performer.scan_interval_override:
+        return timedelta(minutes=performer.scan_interval_override)
+    if min_minutes is None or max_minutes is None:
+        min_minutes, max_minutes = get_scan_interval_bounds()
+    now = now or datetime.utcnow()
+
+    days = get_upload_days(performer)
+    gaps = [(newer - older).days for newer, older in zip(days, days[1:])]
+    if gaps:
+        gaps.sort()
+        typical_gap = timedelta(days=gaps[len(gaps) // 2])
+    else:
+        typical_gap = DEFAULT_UPLOAD_GAP
+
+    interval = typical_gap / CHECKS_PER_UPLOAD_GAP
+    if days:
+        since_last = now - datetime.combine(days[0], datetime.min.time())
+        if since_last > typical_gap:
+            interval *= 2 ** math.floor(math.log2(since_last / typical_gap))
+
+    return min(max(interval, timedelta(minutes=min_minutes)), timedelta(minutes=max_minutes))
+
+def schedule_next_scan(performer, now=None):
+    """Sets performer.next_scan_at from its upload history (caller commits)."""
+    now = now or datetime.utcnow()
+    performer.next_scan_at = now + compute_scan_interval(performer, now=now)
+    return performer.next_scan_at
+
+# Shallow scans run on the adaptive per-performer interval; deep scans of the
+# whole listing on this much longer cadence (Settings 'deep_scan_interval', hours).
+DEFAULT_DEEP_SCAN_INTERVAL = 7 * 24
+
+_scan_stats_lock = threading.Lock()
+
+def get_deep_scan_interval():
+    """Returns the deep scan interval in hours (0 = only on demand and for new performers)."""
+    setting = Settings.query.filter_by(key='deep_scan_interval').first()
+    if setting and setting.value and setting.value.isdigit():
+        return int(setting.value)
+    return DEFAULT_DEEP_SCAN_INTERVAL
+
+def choose_scan_mode(performer, now=None):
+    """Deep if the performer has never had a full scan or its deep interval has elapsed, else shallow."""
+    if performer.last_deep_scan is None:
+        return SCAN_MODE_DEEP
+    hours = get_deep_scan_interval()
+    now = now or datetime.utcnow()
+    if hours and now - performer.last_deep_scan >= timedelta(hours=hours):
+        return SCAN_MODE_DEEP
+    return SCAN_MODE_SHALLOW
+
+def get_scan_stats():
+    """Returns per-mode scan stats: {mode: {count, seconds, found, new, last_at}}."""
+    setting = Settings.query.filter_by(key='scan_stats').first()
+    try:
+        return json.loads(setting.value) if setting and setting.value else {}
+    except ValueError:
+        return {}
+
+def record_scan_stats(mode, seconds, found, new, unchanged=False):
+    """Adds one scan to the running totals for its mode and commits."""
+    with _scan_stats_lock:
+        stats = get_scan_stats()
+        entry = stats.setdefault(mode, {'count': 0, 'seconds': 0, 'found': 0, 'new': 0})
+        entry['count'] += 1
+        if unchanged:
+            entry['unchanged'] = entry.get('unchanged', 0) + 1
+        entry['seconds'] = round(entry['seconds'] + seconds, 1)
+        entry['found'] += found
+        entry['new'] += new
+        entry['last_at'] = datetime.utcnow().isoformat()
+
+        setting = Settings.query.filter_by(key='scan_stats').first() or Settings(key='scan_stats')
+        setting.value = json.dumps(stats)
+        db.session.add(setting)
+        # Commit under the lock so parallel scheduled scans don't lose each other's counts
+        db.session.commit()
+
+def scan_performer_service(performer, task_id=None, mode=None, on_new_videos=None):
     """
     Core logic for scanning a performer.
     Shared by manual scan (routes.py) and scheduled scan (scheduler.py).
+    mode is SCAN_MODE_SHALLOW or SCAN_MODE_DEEP; None picks one with choose_scan_mode().
+
+    Listing pages are processed and committed one at a time as the scraper
+    yields them. on_new_videos, if given, is called after each commit with the
+    ids of that page's newly added 'new' videos, so auto-downloads can start
+    while later pages are still being fetched.
     """
+    mode = mode or choose_scan_mode(performer)
+    started = time.time()
     if task_id:
-        update_task_progress(task_id, progress=10, message=f"Starting scan for {performer.name}...")
+        update_task_progress(task_id, progress=10, message=f"Starting {mode} scan for {performer.name}...")
     else:
-        print(f"Starting scan for {performer.name}...")
+        print(f"Starting {mode} scan for {performer.name}...")
     
-    # 1. Scrape new videos
-    videos = scrape_performer(performer, task_id)
-    
-    if task_id:
-        update_task_progress(task_id, progress=50, message=f"Processing videos for {performer.name}...")
-    
-    # Get settings
-    local_path_setting = Settings.query.filter_by(key='local_scan_path').first()
-    local_path = local_path_setting.value if (local_path_setting and local_path_setting.value) else None
+    # 1. Scrape new videos (shallow scans stop once they reach videos we already have)
+    known_viewkeys = None
+    if mode == SCAN_MODE_SHALLOW:
+        known_viewkeys = {key for (key,) in db.session.query(Video.viewkey).filter(Video.performer_id == performer.id)}
+    pages = iter_performer_pages(performer, task_id, mode=mode, known_viewkeys=known_viewkeys,
+                                 skip_unchanged_since=performer.last_scan)
+    try:
+        first_page = next(pages, None)
+    except ListingUnchanged:
+        # First page is identical to what the last completed scan processed:
+        # nothing new to find, so skip the rest of the pages and all processing.
+        performer.last_scan = datetime.utcnow()
+        schedule_next_scan(performer)
+        db.session.commit()
+        record_scan_stats(mode, time.time() - started, 0, 0, unchanged=True)
+        if task_id:
+            update_task_progress(task_id, progress=100, message=f"No changes for {performer.name}.")
+        return {'new_count': 0, 'total_found': 0, 'mode': mode, 'unchanged': True, 'new_video_ids': []}
     
-    # Check for site-specific path
-    if performer.site == 'x':
-        local_path_x_setting = Settings.query.filter_by(key='local_scan_path_x').first()
-        if local_path_x_setting and local_path_x_setting.value:
-            local_path = local_path_x_setting.value
-    elif performer.site == 'pornhub':
-        local_path_ph_setting = Settings.query.filter_by(key='local_scan_path_pornhub').first()
-        if local_path_ph_setting and local_path_ph_setting.value:
-            local_path = local_path_ph_setting.value
-    elif performer.site == 'xhamster':
-        local_path_xh_setting = Settings.query.filter_by(key='local_scan_path_xhamster').first()
-        if local_path_xh_setting and local_path_xh_setting.value:
-            local_path = local_path_xh_setting.value
+    # Get settings (site-specific local path, else the main one)
+    local_path = get_local_path(performer.site)
     
     stash_check_setting = Settings.query.filter_by(key='stash_check_existing').first()
     check_stash = stash_check_setting.value == 'true' if stash_check_setting else True
@@ -46,121 +187,102 @@ def scan_performer_service(performer, task_id=None):
     local_check_setting = Settings.query.filter_by(key='local_check_existing').first()
     check_local_files = local_check_setting.value == 'true' if local_check_setting else True
     
-    local_filenames = []
     if local_path and check_local_files:
         if task_id:
             update_task_progress(task_id, message=f"Indexing local files for {performer.name}...")
         try:
-            for root, dirs, files in os.walk(local_path):
-                for file in files:
-                    local_filenames.append(file)
+            # Covers every configured path, so the other performers' scans reuse this refresh
+            local_index.refresh(get_local_roots())
         except Exception as e:
             print(f"Error scanning local path: {e}")
 
     # Helper to check if video exists locally
-    def check_local(viewkey, title):
-        if not check_local_files:
-            return False
-        if not local_filenames:
+    def check_local(viewkey, media_ids=None):
+        if not check_local_files or not local_path:
             return False
-        # Optimization: Check viewkey first as it's unique and likely in filename
-        for fname in local_filenames:
-            if viewkey in fname:
-                return True
-        
-        return False
+        return local_index.contains(local_path, [viewkey] + list(media_ids or []))
 
     if task_id:
         update_task_progress(task_id, progress=50, message=f"Processing videos for {performer.name}...")
     
+    # Stash lookups for the whole scan go through the shared client, in bulk
+    stash = get_stash_client() if check_stash else None
+
+    def check_stash_bulk(videos):
+        if not stash:
+            return [False] * len(videos)
+        return stash.check_videos_exist(videos)
+
     # 2. Process EXISTING 'new' videos (Filter & Sync)
     existing_new_videos = Video.query.filter_by(performer_id=performer.id, status='new').all()
+    stash_candidates = []
     for vid in existing_new_videos:
         # Filter check
         if not is_video_allowed(vid.title, performer, vid.duration):
             vid.status = 'ignored'
             continue
             
-        # Sync check (Local & Stash)
-        in_local = check_local(vid.viewkey, vid.title)
-        if in_local:
+        # Sync check (Local, then Stash for whatever isn't on disk)
+        # Parse stored media_ids
+        media_ids = vid.media_ids.split(',') if vid.media_ids else None
+        if check_local(vid.viewkey, media_ids):
             vid.status = 'downloaded'
             continue
-            
-        in_stash = False
-        if check_stash:
-            # Parse stored media_ids
-            media_ids = vid.media_ids.split(',') if vid.media_ids else None
-            in_stash = check_stash_video(vid.url, vid.title, vid.viewkey, media_ids)
-            
-        if in_stash:
+        stash_candidates.append((vid, {'url': vid.url, 'title': vid.title, 'alternative_ids': media_ids}))
+    
+    in_stash = check_stash_bulk([c for _, c in stash_candidates])
+    for (vid, _), found in zip(stash_candidates, in_stash):
+        if found:
             vid.status = 'downloaded'
             
     # 3. Process EXISTING 'downloaded' videos (Revert if missing)
-    # This handles the case where user deletes a file locally
-    # Only run this if we are actually checking!
+    # This handles the case where user deletes a file locally.
+    # Only revert if we CHECKED and didn't find it in any enabled check;
+    # with both checks disabled nothing is reverted.
     if check_local_files or check_stash:
         existing_downloaded_videos = Video.query.filter_by(performer_id=performer.id, status='downloaded').all()
+        missing_locally = [vid for vid in existing_downloaded_videos
+                           if not check_local(vid.viewkey, vid.media_ids.split(',') if vid.media_ids else None)]
+        in_stash = check_stash_bulk([{'url': vid.url, 'title': vid.title} for vid in missing_locally])
         reverted_count = 0
-        for vid in existing_downloaded_videos:
-            # Check if still exists
-            in_local = check_local(vid.viewkey, vid.title)
-            
-            in_stash = False
-            if check_stash:
-                in_stash = check_stash_video(vid.url, vid.title, vid.viewkey)
-            
-            # If we are checking both, and neither found -> revert
-            # If we are only checking one, and it's not found -> revert?
-            # Logic:
-            # If checking local AND checking stash: if not in either -> new
-            # If checking local ONLY: if not in local -> new
-            # If checking stash ONLY: if not in stash -> new
-            
-            # Simplified:
-            found = False
-            if check_local_files and in_local: found = True
-            if check_stash and in_stash: found = True
-            
-            # If we didn't find it in any of the enabled checks, revert
-            # But wait, if we disable checking, we assume it's there? Or we just don't update?
-            # If I disable checking, I probably don't want to revert 'downloaded' to 'new'.
-            # So we should only revert if we CHECKED and didn't find.
-            
-            should_revert = True
-            if check_local_files and in_local: should_revert = False
-            if check_stash and in_stash: should_revert = False
-            
-            # If we disabled both checks, we shouldn't revert anything.
-            if not check_local_files and not check_stash:
-                should_revert = False
-                
-            if should_revert:
+        for vid, found in zip(missing_locally, in_stash):
+            if not found:
                 vid.status = 'new'
                 reverted_count += 1
             
-    # Update last_scan
-    performer.last_scan = datetime.utcnow()
-            
-    new_videos_count = 0
-    total_videos = len(videos)
+    # 4. Add new videos page by page as they arrive
+    new_video_ids = []
+    total_videos = 0
+    seen_viewkeys = set()
+    batches = itertools.chain([first_page] if first_page else [], pages)
     
-    for i, v_data in enumerate(videos):
-        # Check if video already exists
-        existing = Video.query.filter_by(performer_id=performer.id, viewkey=v_data['viewkey']).first()
-        if not existing:
-            # Check Stash
-            in_stash = False
-            if check_stash:
-                in_stash = check_stash_video(v_data['url'], v_data['title'], v_data['viewkey'], v_data.get('media_ids'))
-            
-            # Check Local Path
-            in_local = check_local(v_data['viewkey'], v_data['title'])
-
-            if not is_video_allowed(v_data['title'], performer, v_data.get('duration')):
+    for page_number, page_videos in enumerate(batches, start=1):
+        # Drop duplicates (listings shift while we paginate) and videos we already have
+        batch = []
+        for v_data in page_videos:
+            if v_data['viewkey'] not in seen_viewkeys:
+                seen_viewkeys.add(v_data['viewkey'])
+                batch.append(v_data)
+        total_videos += len(batch)
+        batch_keys = [v['viewkey'] for v in batch]
+        existing_keys = {key for (key,) in db.session.query(Video.viewkey).filter(
+            Video.performer_id == performer.id, Video.viewkey.in_(batch_keys))} if batch_keys else set()
+        
+        # Filter and local checks first; Stash is asked once for the rest of the page
+        fresh = [v_data for v_data in batch if v_data['viewkey'] not in existing_keys]
+        allowed = [is_video_allowed(v_data['title'], performer, v_data.get('duration')) for v_data in fresh]
+        in_local = [check_local(v_data['viewkey'], v_data.get('media_ids')) for v_data in fresh]
+        stash_indexes = [i for i in range(len(fresh)) if allowed[i] and not in_local[i]]
+        stash_results = check_stash_bulk([{'url': fresh[i]['url'], 'title': fresh[i]['title'],
+                                           'alternative_ids': fresh[i].get('media_ids')} for i in stash_indexes])
+        in_stash = dict(zip(stash_indexes, stash_results))
+        
+        added = []
+        for i, v_data in enumerate(fresh):
+            if not allowed[i]:
                 status = 'ignored'
             else:
-                status = 'downloaded' if (in_stash or in_local) else 'new'
+                status = 'downloaded' if (in_stash.get(i) or in_local[i]) else 'new'
             
             # Join media_ids list to string for storage
             media_ids_str = ",".join(v_data.get('media_ids', [])) if v_data.get('media_ids') else None
@@ -176,17 +298,29 @@ def scan_performer_service(performer, task_id=None):
                 status=status
             )
             db.session.add(video)
-            if status == 'new':
-                new_videos_count += 1
+            added.append(video)
         
-        # Update progress for processing
-        if task_id and total_videos > 0:
-            percent = round(50 + ((i / total_videos) * 40), 1)
-            update_task_progress(task_id, progress=percent, message=f"Processing {performer.name}: {i+1}/{total_videos}...")
+        # Commit per page so new videos show up (and can be downloaded) while pagination continues
+        db.session.commit()
+        page_new_ids = [v.id for v in added if v.status == 'new']
+        new_video_ids.extend(page_new_ids)
+        if on_new_videos and page_new_ids:
+            on_new_videos(page_new_ids)
+        
+        if task_id:
+            percent = min(90, 50 + page_number * 5)
+            update_task_progress(task_id, progress=percent, message=f"Processing {performer.name}: page {page_number}, {len(new_video_ids)} new so far...")
     
+    # Update last_scan only once every page is in, so an interrupted scan isn't
+    # mistaken for a complete one (see ListingUnchanged)
+    performer.last_scan = datetime.utcnow()
+    if mode == SCAN_MODE_DEEP:
+        performer.last_deep_scan = performer.last_scan
+    schedule_next_scan(performer)
     db.session.commit()
+    record_scan_stats(mode, time.time() - started, total_videos, len(new_video_ids))
     
     if task_id:
-        update_task_progress(task_id, progress=100, message=f"Scan complete for {performer.name}. Found {new_videos_count} new.")
+        update_task_progress(task_id, progress=100, message=f"Scan complete for {performer.name}. Found {len(new_video_ids)} new.")
         
-    return {'new_count': new_videos_count, 'total_found': len(videos), 'new_video_ids': [v.id for v in db.session.new if isinstance(v, Video) and v.status == 'new']}
+    return {'new_count': len(new_video_ids), 'total_found': total_videos, 'mode': mode, 'new_video_ids': new_video_ids}
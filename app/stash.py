@@ -1,30 +1,135 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 from app.models import Settings
+import os
+import re
+import threading
 import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+BULK_ALIASES = 100 # Aliased fields per GraphQL request (_post_batch)
+
+# Transport: every StashClient in a process shares keep-alive connections
+# (one requests.Session per thread, as in fetcher.py) and the same retry
+# policy. Queries are retried on connection errors, timeouts and 502/503/504;
+# a mutation may already have run, so it is only retried when the connection
+# itself could not be made.
+STASH_TIMEOUT = float(os.environ.get('STASH_TIMEOUT', 10)) # Seconds per request
+STASH_RETRIES = int(os.environ.get('STASH_RETRIES', 2))
+STASH_BACKOFF = float(os.environ.get('STASH_BACKOFF', 0.5)) # Seconds, doubled per retry
+STASH_POOL_SIZE = 4 # Keep-alive connections per thread
+RETRY_STATUSES = (502, 503, 504)
+
+# Stash settings are cached per process. Saving them invalidates this
+# worker's copy; other workers re-read within STASH_CONFIG_REFRESH seconds.
+STASH_CONFIG_REFRESH = 60
+
+FIND_SCENE_BY_PATH_FIELD = """findScenes(scene_filter: {
+            path: {value: $path, modifier: INCLUDES}
+          }) {
+            scenes {
+              id
+              files {
+                path
+              }
+            }
+          }"""
+
+FIND_PERFORMER_BY_NAME_FIELD = """findPerformers(performer_filter: {
+            name: {value: $name, modifier: EQUALS}
+          }) {
+            performers {
+              id
+              name
+            }
+          }"""
+
+_local = threading.local()
+_config_lock = threading.Lock()
+_config = None # (url, api_key, path_mapping)
+_config_loaded_at = 0
+_client = None
+
+def _get_session():
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=STASH_POOL_SIZE, max_retries=0)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _local.session = session
+    return session
+
+def get_stash_settings():
+    """Returns (url, api_key, path_mapping) from Settings, cached for STASH_CONFIG_REFRESH seconds."""
+    global _config, _config_loaded_at
+    with _config_lock:
+        if _config is not None and time.time() - _config_loaded_at < STASH_CONFIG_REFRESH:
+            return _config
+    url = Settings.query.filter_by(key='stash_url').first()
+    api_key = Settings.query.filter_by(key='stash_api_key').first()
+    path_mapping = Settings.query.filter_by(key='stash_path_mapping').first()
+    if not url or not url.value:
+        config = (None, None, None)
+    else:
+        config = (url.value, api_key.value if api_key else None, path_mapping.value if path_mapping else None)
+    with _config_lock:
+        _config, _config_loaded_at = config, time.time()
+    return config
+
+def invalidate_stash_config():
+    """Drops the cached settings (and the shared client built from them) after they change."""
+    global _config, _client
+    with _config_lock:
+        _config = None
+        _client = None
+
+def get_stash_client():
+    """The process-wide StashClient, rebuilt when the Stash settings change."""
+    global _client
+    config = get_stash_settings()
+    with _config_lock:
+        if _client is None or _client.config != config:
+            _client = StashClient(config)
+        return _client
+
+def _never_sent(error):
+    """True if a requests error happened while connecting, before anything reached Stash."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    # Refused / unresolvable: ConnectionError(MaxRetryError(reason=NewConnectionError))
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
 class StashClient:
     def _get_config(self):
-        url = Settings.query.filter_by(key='stash_url').first()
-        api_key = Settings.query.filter_by(key='stash_api_key').first()
-        path_mapping = Settings.query.filter_by(key='stash_path_mapping').first()
-        
-        if not url or not url.value:
-            return None, None, None
-        
-        return url.value, api_key.value if api_key else None, path_mapping.value if path_mapping else None
+        return get_stash_settings()
 
-    def __init__(self):
-        self.url, self.api_key, self.path_mapping = self._get_config()
+    def __init__(self, config=None):
+        self.config = config or self._get_config()
+        self.url, self.api_key, self.path_mapping = self.config
         self.headers = {"Content-Type": "application/json"}
         if self.api_key:
             self.headers["ApiKey"] = self.api_key
+        self._use_mirror = False
+        self._mirror_checked_at = 0
 
     def is_configured(self):
         return bool(self.url)
 
+    @property
+    def use_mirror(self):
+        """Whether lookups can be answered from the local scene mirror (see stash_mirror)."""
+        # The shared client lives as long as the process; re-check now and then
+        if time.time() - self._mirror_checked_at > STASH_CONFIG_REFRESH:
+            from app.stash_mirror import mirror_ready
+            self._use_mirror = mirror_ready(self.url)
+            self._mirror_checked_at = time.time()
+        return self._use_mirror
+
     def _apply_path_mapping(self, path):
         """Applies path mapping to a local path."""
         if not self.path_mapping:
@@ -52,13 +157,53 @@ class StashClient:
         if not self.url:
             raise Exception("Stash URL not configured")
             
-        try:
-            response = requests.post(self.url, json={'query': query, 'variables': variables}, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            logger.error(f"Error querying Stash: {e}")
-            return None
+        is_query = not query.lstrip().startswith('mutation')
+        for attempt in range(STASH_RETRIES + 1):
+            retry = False
+            try:
+                response = _get_session().post(self.url, json={'query': query, 'variables': variables},
+                                               headers=self.headers, timeout=STASH_TIMEOUT)
+                if response.status_code in RETRY_STATUSES and is_query and attempt < STASH_RETRIES:
+                    retry = True
+                else:
+                    response.raise_for_status()
+                    return response.json()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # A dropped connection or read timeout may come after Stash ran the request
+                if not (is_query or _never_sent(e)) or attempt >= STASH_RETRIES:
+                    logger.error(f"Error querying Stash: {e}")
+                    return None
+                retry = True
+            except Exception as e:
+                logger.error(f"Error querying Stash: {e}")
+                return None
+            if retry:
+                time.sleep(STASH_BACKOFF * (2 ** attempt))
+        return None
+
+    def _post_batch(self, fields):
+        """Sends several query fields as aliased parts of one GraphQL document.
+
+        fields is a list of (field, {name: (graphql_type, value)}), where each
+        field refers to its own variables as $name. Returns one result per
+        field, in order (None where Stash returned nothing), using
+        BULK_ALIASES fields per request.
+        """
+        results = []
+        for start in range(0, len(fields), BULK_ALIASES):
+            chunk = fields[start:start + BULK_ALIASES]
+            params, parts, variables = [], [], {}
+            for i, (field, field_vars) in enumerate(chunk):
+                for name, (graphql_type, value) in field_vars.items():
+                    params.append(f'${name}_{i}: {graphql_type}')
+                    variables[f'{name}_{i}'] = value
+                    field = re.sub(rf'\${name}\b', f'${name}_{i}', field)
+                parts.append(f'  f{i}: {field}')
+            signature = f"({', '.join(params)})" if params else ''
+            data = self._post(f"query Batch{signature} {{\n" + '\n'.join(parts) + "\n}", variables)
+            returned = (data or {}).get('data') or {}
+            results.extend(returned.get(f'f{i}') for i in range(len(chunk)))
+        return results
 
     def test_connection(self):
         if not self.url:
@@ -75,6 +220,9 @@ class StashClient:
     def check_video_exists(self, url, title, viewkey=None, alternative_ids=None):
         if not self.url:
             return False
+        if self.use_mirror:
+            from app.stash_mirror import match_videos
+            return match_videos([{'url': url, 'title': title, 'alternative_ids': alternative_ids}])[0]
 
         # 1. Check by URL (Exact Match)
         query_url = """
@@ -122,6 +270,41 @@ class StashClient:
             
         return False
 
+    def check_videos_exist(self, videos):
+        """Bulk version of check_video_exists.
+
+        videos is a list of dicts with 'url', 'title' and optionally
+        'alternative_ids'. Returns a list of booleans in the same order. Each
+        distinct URL and path term becomes one aliased findScenes field, sent
+        BULK_ALIASES at a time: URLs first, then path terms only for videos
+        whose URL wasn't found.
+        """
+        if not self.url or not videos:
+            return [False] * len(videos)
+        if self.use_mirror:
+            from app.stash_mirror import match_videos
+            return match_videos(videos)
+
+        url_hits = self._count_matches('url', 'EQUALS', {v['url'] for v in videos if v.get('url')})
+        found = [bool(v.get('url') and url_hits.get(v['url'])) for v in videos]
+
+        # Same search terms as check_video_exists: media IDs, else the title
+        terms = {}
+        for i, v in enumerate(videos):
+            if not found[i]:
+                terms[i] = list(v.get('alternative_ids') or []) or ([v['title']] if v.get('title') else [])
+        path_hits = self._count_matches('path', 'INCLUDES', {t for ts in terms.values() for t in ts})
+        for i, ts in terms.items():
+            found[i] = any(path_hits.get(t) for t in ts)
+        return found
+
+    def _count_matches(self, field, modifier, values):
+        """Returns {value: True/False} for whether any scene's `field` matches each value."""
+        values = list(values)
+        query = f'findScenes(scene_filter: {{{field}: {{value: $v, modifier: {modifier}}}}}) {{ count }}'
+        results = self._post_batch([(query, {'v': ('String!', value)}) for value in values])
+        return {value: bool(result and result['count'] > 0) for value, result in zip(values, results)}
+
     def scan_file(self, path):
         """Triggers a metadata scan for a specific file path."""
         if not self.url:
@@ -195,74 +378,73 @@ class StashClient:
 
     def find_scene_by_path(self, path):
         """Finds a scene ID by its file path or viewkey."""
-        if not self.url:
-            return None
-            
-        # Optimization: Extract viewkey if present in filename [viewkey]
-        # This is much more robust than searching for the full filename which might have special chars
-        import re
-        search_term = path
-        viewkey_match = re.search(r'\[([a-zA-Z0-9\-_]+)\]', path)
-        if viewkey_match:
-            search_term = viewkey_match.group(1)
-            logger.debug(f"Searching Stash by viewkey: {search_term}")
-        
-        query = """
-        query FindSceneIdByPath($path: String!) {
-          findScenes(scene_filter: {
-            path: {value: $path, modifier: INCLUDES}
-          }) {
-            scenes {
-              id
-              files {
-                path
-              }
-            }
-          }
-        }
-        """
-        data = self._post(query, {'path': search_term})
-        if data and 'data' in data and 'findScenes' in data['data']:
-            scenes = data['data']['findScenes']['scenes']
-            
-            # If we searched by viewkey, we might get multiple results (unlikely but possible)
-            # We should try to match the filename if possible, but if we only have one result, it's probably it.
-            if len(scenes) == 1:
-                return scenes[0]['id']
-                
-            for scene in scenes:
-                # Double check if any file path matches exactly or ends with our path
-                for f in scene.get('files', []):
-                    if f['path'] == path or f['path'].endswith(path):
-                        return scene['id']
-                    # Also check if viewkey is in the path
-                    if viewkey_match and viewkey_match.group(1) in f['path']:
-                         return scene['id']
-                         
-        return None
+        scene_ids, _ = self.find_scenes_for_files([path])
+        return scene_ids[0] if scene_ids else None
 
     def find_performer(self, name):
         """Finds a performer ID by name."""
-        if not self.url or not name:
-            return None
-            
-        query = """
-        query FindPerformerByName($name: String!) {
-          findPerformers(performer_filter: {
-            name: {value: $name, modifier: EQUALS}
-          }) {
-            performers {
-              id
-              name
-            }
-          }
-        }
+        _, performer_id = self.find_scenes_for_files([], performer_name=name)
+        return performer_id
+
+    def find_scenes_for_files(self, paths, performer_name=None):
+        """Looks up the scenes for downloaded files and, optionally, a performer.
+
+        Returns ([scene_id or None per path], performer_id or None). Files
+        found in the mirror are answered locally; everything else goes to
+        Stash as one aliased request.
         """
-        data = self._post(query, {'name': name})
-        if data and 'data' in data and 'findPerformers' in data['data']:
-            performers = data['data']['findPerformers']['performers']
-            if performers:
-                return performers[0]['id']
+        if not self.url:
+            return [None] * len(paths), None
+
+        scene_ids = [None] * len(paths)
+        lookups = []
+        for i, path in enumerate(paths):
+            # Optimization: Extract viewkey if present in filename [viewkey]
+            # This is much more robust than searching for the full filename which might have special chars
+            search_term = path
+            viewkey_match = re.search(r'\[([a-zA-Z0-9\-_]+)\]', path)
+            if viewkey_match:
+                search_term = viewkey_match.group(1)
+                logger.debug(f"Searching Stash by viewkey: {search_term}")
+
+            if self.use_mirror:
+                from app.stash_mirror import find_scenes_by_term
+                scene_ids[i] = self._pick_scene(find_scenes_by_term(search_term), path, viewkey_match)
+                if scene_ids[i]:
+                    continue
+                # Not mirrored yet (e.g. created by the scan we just triggered): ask Stash
+            lookups.append((i, path, search_term, viewkey_match))
+
+        fields = [(FIND_SCENE_BY_PATH_FIELD, {'path': ('String!', term)}) for _, _, term, _ in lookups]
+        if performer_name:
+            fields.append((FIND_PERFORMER_BY_NAME_FIELD, {'name': ('String!', performer_name)}))
+        results = self._post_batch(fields) if fields else []
+
+        for (i, path, _, viewkey_match), result in zip(lookups, results):
+            if result:
+                scenes = [(s['id'], [f['path'] for f in s.get('files', [])]) for s in result['scenes']]
+                scene_ids[i] = self._pick_scene(scenes, path, viewkey_match)
+
+        performer_id = None
+        if performer_name and results and results[-1] and results[-1]['performers']:
+            performer_id = results[-1]['performers'][0]['id']
+        return scene_ids, performer_id
+
+    def _pick_scene(self, scenes, path, viewkey_match):
+        """Chooses the scene for path among [(scene_id, [file paths])] search results."""
+        # If we searched by viewkey, we might get multiple results (unlikely but possible)
+        # We should try to match the filename if possible, but if we only have one result, it's probably it.
+        if len(scenes) == 1:
+            return scenes[0][0]
+            
+        for scene_id, file_paths in scenes:
+            # Double check if any file path matches exactly or ends with our path
+            for file_path in file_paths:
+                if file_path == path or file_path.endswith(path):
+                    return scene_id
+                # Also check if viewkey is in the path
+                if viewkey_match and viewkey_match.group(1) in file_path:
+                     return scene_id
         return None
 
     def scrape_scene(self, scene_id):
@@ -338,13 +520,13 @@ class StashClient:
 
 # Wrapper functions for backward compatibility
 def get_stash_config():
-    client = StashClient()
+    client = get_stash_client()
     return client.url, client.api_key
 
 def check_stash_video(url, title, viewkey=None, alternative_ids=None):
-    client = StashClient()
+    client = get_stash_client()
     return client.check_video_exists(url, title, viewkey, alternative_ids)
 
 def test_stash_connection():
-    client = StashClient()
+    client = get_stash_client()
     return client.test_connection()
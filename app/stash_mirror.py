@@ -0,0 +1,319 @@
+from app import db
+from app.models import Settings, StashScene, StashSceneKey
+from sqlalchemy import func as sa_func, intersect
+from app.local_index import filename_tokens, MIN_TOKEN_LENGTH
+from datetime import datetime, timedelta, timezone
+import logging
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Local mirror of the Stash library (scene ids, URLs, file paths, and the id
+# tokens and words in file names), so existence checks during scans are indexed lookups
+# instead of GraphQL round-trips. The scheduler leader syncs it every
+# STASH_MIRROR_SYNC_MINUTES, fetching only scenes whose updated_at is past the
+# last checkpoint; a full resync (which also drops scenes deleted in Stash)
+# runs on demand and every STASH_MIRROR_FULL_SYNC_HOURS. Until one full sync
+# of the configured server has finished, StashClient keeps querying Stash live.
+STASH_MIRROR_SYNC_MINUTES = 15
+STASH_MIRROR_FULL_SYNC_HOURS = 24
+STASH_MIRROR_PAGE_SIZE = 500
+CHECKPOINT_OVERLAP = timedelta(seconds=1) # Re-read the checkpoint second; edits can share it
+LOOKUP_BATCH = 500 # Values per IN query (SQLite variable limit)
+MIN_WORD_LENGTH = 2 # Single letters are in nearly every file name
+PATH_LIKE_LIMIT = 20 # Unindexed path substring scans per match_videos call
+MIRROR_FORMAT = '2' # Bump when _store_scenes adds a kind of key; forces a full resync
+
+TOKEN_RE = re.compile(r'^[A-Za-z0-9]+$')
+WORD_RE = re.compile(r'[^\W_]+')
+
+MIRROR_SCENES_QUERY = """
+query MirrorScenes($filter: FindFilterType, $scene_filter: SceneFilterType) {
+  findScenes(filter: $filter, scene_filter: $scene_filter) {
+    count
+    scenes {
+      id
+      title
+      updated_at
+      urls
+      files {
+        path
+      }
+    }
+  }
+}
+"""
+
+_sync_lock = threading.Lock()
+
+def _get(key):
+    setting = Settings.query.filter_by(key=key).first()
+    return setting.value if setting else None
+
+def _set(key, value):
+    setting = Settings.query.filter_by(key=key).first() or Settings(key=key)
+    setting.value = value
+    db.session.add(setting)
+
+def _parse_timestamp(value):
+    """Stash RFC 3339 timestamp -> naive UTC datetime (None if unparseable)."""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def mirror_ready(stash_url):
+    """True once a full sync of stash_url has completed (a different server needs its own)."""
+    return (bool(stash_url) and _get('stash_mirror_url') == stash_url and bool(_get('stash_mirror_last_full'))
+            and _get('stash_mirror_format') == MIRROR_FORMAT)
+
+def _phrase(text):
+    """Case-folded words of a title or file name, space-separated and padded for whole-word matching."""
+    return f" {' '.join(w.casefold() for w in WORD_RE.findall(text) if len(w) >= MIN_WORD_LENGTH)} "
+
+def title_words(text):
+    return set(_phrase(text).split())
+
+def _store_scenes(scenes, synced_at):
+    """Upserts one page of findScenes results with their lookup keys."""
+    ids = [scene['id'] for scene in scenes]
+    db.session.query(StashSceneKey).filter(StashSceneKey.scene_id.in_(ids)).delete(synchronize_session=False)
+    keys = []
+    for scene in scenes:
+        db.session.merge(StashScene(id=scene['id'], title=(scene.get('title') or '')[:512],
+                                    updated_at=_parse_timestamp(scene.get('updated_at')), synced_at=synced_at))
+        for url in scene.get('urls') or []:
+            keys.append({'scene_id': scene['id'], 'kind': 'url', 'value': url[:1024]})
+        words = set()
+        for f in scene.get('files') or []:
+            keys.append({'scene_id': scene['id'], 'kind': 'path', 'value': f['path'][:1024]})
+            basename = os.path.basename(f['path'])
+            for token in filename_tokens(basename):
+                keys.append({'scene_id': scene['id'], 'kind': 'token', 'value': token[:1024]})
+            words.update(title_words(os.path.splitext(basename)[0]))
+        for word in words:
+            keys.append({'scene_id': scene['id'], 'kind': 'word', 'value': word[:1024]})
+    if keys:
+        db.session.execute(StashSceneKey.__table__.insert(), keys)
+
+def sync_stash_mirror(full=False, task_id=None):
+    """Pulls scenes changed since the last checkpoint (or everything, if full) into the mirror.
+
+    Returns the number of scenes stored, or None if Stash isn't configured or
+    another sync is already running in this process. A full pass that saw
+    fewer scenes than Stash reported removes nothing and is repeated next run.
+    """
+    from app.stash import get_stash_client
+    from app.tasks import update_task_progress
+
+    client = get_stash_client()
+    if not client.is_configured():
+        return None
+    if not _sync_lock.acquire(blocking=False):
+        return None
+    try:
+        last_full = _get('stash_mirror_last_full')
+        checkpoint = _get('stash_mirror_checkpoint')
+        if _get('stash_mirror_url') != client.url or not last_full or not checkpoint:
+            full = True
+        elif _get('stash_mirror_format') != MIRROR_FORMAT:
+            full = True
+        elif datetime.utcnow() - datetime.fromisoformat(last_full) > timedelta(hours=STASH_MIRROR_FULL_SYNC_HOURS):
+            full = True
+
+        scene_filter = None
+        if not full:
+            since = datetime.fromisoformat(checkpoint) - CHECKPOINT_OVERLAP
+            scene_filter = {'updated_at': {'value': since.strftime('%Y-%m-%dT%H:%M:%SZ'), 'modifier': 'GREATER_THAN'}}
+
+        started = datetime.utcnow()
+        newest = datetime.fromisoformat(checkpoint) if (checkpoint and not full) else None
+        stored = 0
+        expected = None # findScenes.count when the pass started
+        seen_ids = set()
+        page = 1
+        while True:
+            # Page by id: a scene edited mid-sync keeps its position, so no other scene shifts out of reach
+            data = client._post(MIRROR_SCENES_QUERY, {
+                'filter': {'page': page, 'per_page': STASH_MIRROR_PAGE_SIZE, 'sort': 'id', 'direction': 'ASC'},
+                'scene_filter': scene_filter,
+            })
+            result = ((data or {}).get('data') or {}).get('findScenes')
+            if result is None:
+                # Stash unreachable or query rejected: keep the old checkpoint and try again next time
+                db.session.rollback()
+                logger.warning(f"Stash mirror sync aborted on page {page}: {(data or {}).get('errors')}")
+                return None
+            scenes = result['scenes']
+            if expected is None:
+                expected = result.get('count') or 0
+            seen_ids.update(scene['id'] for scene in scenes)
+            if scenes:
+                _store_scenes(scenes, started)
+                db.session.commit()
+                stored += len(scenes)
+                for scene in scenes:
+                    updated = _parse_timestamp(scene.get('updated_at'))
+                    if updated and (newest is None or updated > newest):
+                        newest = updated
+            if task_id:
+                total = result.get('count') or stored
+                update_task_progress(task_id, progress=round(100 * stored / total, 1) if total else 100,
+                                     message=f"Syncing Stash mirror: {stored}/{total} scenes...")
+            if len(scenes) < STASH_MIRROR_PAGE_SIZE:
+                break
+            page += 1
+
+        if full and len(seen_ids) < expected:
+            # Scenes were deleted while we paged, so some offsets shifted past
+            # scenes we never fetched. Don't treat those as deleted; keep the
+            # previous full-sync time so the next run repeats the full pass.
+            logger.warning(f"Stash mirror full sync saw {len(seen_ids)} of {expected} scenes; will retry.")
+            _set('stash_mirror_synced_at', datetime.utcnow().isoformat())
+            db.session.commit()
+            return stored
+
+        if full:
+            # Anything not seen in a complete full pass is gone from Stash
+            stale = [sid for (sid,) in db.session.query(StashScene.id).filter(StashScene.synced_at < started)]
+            for i in range(0, len(stale), LOOKUP_BATCH):
+                chunk = stale[i:i + LOOKUP_BATCH]
+                db.session.query(StashSceneKey).filter(StashSceneKey.scene_id.in_(chunk)).delete(synchronize_session=False)
+                db.session.query(StashScene).filter(StashScene.id.in_(chunk)).delete(synchronize_session=False)
+            _set('stash_mirror_last_full', started.isoformat())
+            _set('stash_mirror_url', client.url)
+            _set('stash_mirror_format', MIRROR_FORMAT)
+        _set('stash_mirror_checkpoint', (newest or started).isoformat())
+        _set('stash_mirror_synced_at', datetime.utcnow().isoformat())
+        db.session.commit()
+        if full or stored:
+            print(f"Stash mirror: {'full' if full else 'incremental'} sync stored {stored} scenes.")
+        return stored
+    finally:
+        _sync_lock.release()
+
+def sync_stash_mirror_task(task_id, full=False):
+    """start_task entry point for the on-demand resync."""
+    from app.tasks import update_task_progress, task_app_context
+    with task_app_context():
+        stored = sync_stash_mirror(full=full, task_id=task_id)
+        if stored is None:
+            update_task_progress(task_id, message="Stash mirror sync skipped (not configured, unreachable or already running).")
+        else:
+            update_task_progress(task_id, progress=100, message=f"Stash mirror synced ({stored} scenes).")
+        return stored
+
+def _values_present(kind, values):
+    """Subset of values that some mirrored scene has as a `kind` key."""
+    values = list(values)
+    present = set()
+    for i in range(0, len(values), LOOKUP_BATCH):
+        chunk = values[i:i + LOOKUP_BATCH]
+        present.update(v for (v,) in db.session.query(StashSceneKey.value).filter(
+            StashSceneKey.kind == kind, StashSceneKey.value.in_(chunk)).distinct())
+    return present
+
+def _is_token(term):
+    # Ids from file names are indexed as tokens; titles are matched by their words
+    return bool(TOKEN_RE.match(term)) and len(term) >= MIN_TOKEN_LENGTH
+
+def _word_counts(words):
+    """{word: number of mirrored scenes with it in a file name} for the words that occur at all."""
+    key = StashSceneKey.__table__
+    words = list(words)
+    counts = {}
+    for i in range(0, len(words), LOOKUP_BATCH):
+        counts.update(db.session.execute(db.select(key.c.value, sa_func.count()).where(
+            key.c.kind == 'word', key.c.value.in_(words[i:i + LOOKUP_BATCH])).group_by(key.c.value)).all())
+    return counts
+
+def _scenes_with_title(title, counts):
+    """Ids of scenes with a file name that includes title, compared word by word (see _phrase).
+
+    Candidates are the scenes that have the title's two rarest words (by
+    counts, from _word_counts); only their paths are then compared.
+    """
+    words = title_words(title)
+    if not words <= counts.keys():
+        return set()
+    key = StashSceneKey.__table__
+    with_word = [db.select(key.c.scene_id).where(key.c.kind == 'word', key.c.value == word)
+                 for word in sorted(words, key=counts.get)[:2]]
+    candidates = [sid for (sid,) in db.session.execute(intersect(*with_word) if len(with_word) > 1 else with_word[0])]
+    phrase = _phrase(title)
+    scene_ids = set()
+    for i in range(0, len(candidates), LOOKUP_BATCH):
+        # Filter by scene only: with kind in the WHERE, SQLite walks every key of that kind instead
+        for scene_id, kind, value in db.session.execute(db.select(key.c.scene_id, key.c.kind, key.c.value).where(
+                key.c.scene_id.in_(candidates[i:i + LOOKUP_BATCH]))):
+            if kind == 'path' and phrase in _phrase(os.path.splitext(os.path.basename(value))[0]):
+                scene_ids.add(scene_id)
+    return scene_ids
+
+def _path_like(term):
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return db.session.query(StashSceneKey.scene_id).filter(
+        StashSceneKey.kind == 'path', StashSceneKey.value.ilike(f'%{escaped}%', escape='\\'))
+
+def match_videos(videos):
+    """Mirror-backed StashClient.check_videos_exist: one boolean per {url, title, alternative_ids}.
+
+    Matches like Stash does (URL equals, path includes), but through indexed
+    keys: id-like terms must be a whole file name token, and a title must
+    appear in a file name as whole words (so punctuation or underscores that
+    yt-dlp put in the file name don't matter). Only terms without any word
+    fall back to a path substring scan, at most PATH_LIKE_LIMIT per call.
+    """
+    urls = _values_present('url', {v['url'] for v in videos if v.get('url')})
+    found = [bool(v.get('url') and v['url'] in urls) for v in videos]
+
+    terms = {}
+    for i, v in enumerate(videos):
+        if not found[i]:
+            terms[i] = list(v.get('alternative_ids') or []) or ([v['title']] if v.get('title') else [])
+    all_terms = {t for ts in terms.values() for t in ts}
+    tokens = _values_present('token', {t for t in all_terms if _is_token(t)})
+    counts = _word_counts({w for t in all_terms if not _is_token(t) for w in title_words(t)})
+    hits = {}
+    scans = 0
+    for t in all_terms:
+        if _is_token(t):
+            hits[t] = t in tokens
+        elif title_words(t):
+            hits[t] = bool(_scenes_with_title(t, counts))
+        else:
+            scans += 1
+            hits[t] = scans <= PATH_LIKE_LIMIT and _path_like(t).first() is not None
+    if scans > PATH_LIKE_LIMIT:
+        logger.warning(f"Stash mirror: {scans} terms without words; {scans - PATH_LIKE_LIMIT} counted as missing.")
+    for i, ts in terms.items():
+        found[i] = any(hits[t] for t in ts)
+    return found
+
+def find_scenes_by_term(term):
+    """[(scene_id, [paths])] for mirrored scenes whose files match term (as in match_videos)."""
+    if _is_token(term):
+        query = db.session.query(StashSceneKey.scene_id).filter(StashSceneKey.kind == 'token', StashSceneKey.value == term)
+        scene_ids = {sid for (sid,) in query.distinct()}
+    elif title_words(term):
+        scene_ids = _scenes_with_title(term, _word_counts(title_words(term)))
+    else:
+        scene_ids = {sid for (sid,) in _path_like(term).distinct()}
+    results = []
+    for scene_id in scene_ids:
+        paths = [p for (p,) in db.session.query(StashSceneKey.value).filter(
+            StashSceneKey.scene_id == scene_id, StashSceneKey.kind == 'path')]
+        results.append((scene_id, paths))
+    return results
+
+def get_mirror_status():
+    return {
+        'scenes': StashScene.query.count(),
+        'synced_at': _get('stash_mirror_synced_at'),
+        'last_full': _get('stash_mirror_last_full'),
+    }
@@ -0,0 +1,144 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Progress events for /task/stream. One feed thread per process reads the task
+# table every TASK_STREAM_INTERVAL and renders each task whose state changed
+# (and its batch) once; every open stream then forwards the events its page
+# listens for. The thread only runs while a stream is open. Each open stream
+# pins a gunicorn thread, so a process holds at most TASK_STREAM_MAX of them;
+# past that, a browser is told to reconnect after TASK_STREAM_BUSY_RETRY.
+TASK_STREAM_INTERVAL = 1.0 # seconds between reads of the task table
+TASK_STREAM_LIFETIME = 300 # seconds (five minutes); EventSource reconnects on its own
+TASK_STREAM_KEEPALIVE = 15 # seconds between comments on an idle stream
+TASK_STREAM_GRACE = 60 # seconds; replay tasks that finished just before the stream (re)connected
+TASK_STREAM_MAX = int(os.environ.get('TASK_STREAM_MAX', 4)) # open streams per process
+TASK_STREAM_BUSY_RETRY = 10 # seconds
+
+class _Subscriber:
+    """One open stream: the latest matching event per task/batch, waiting to be sent."""
+
+    def __init__(self, matches):
+        self.matches = matches
+        self.pending = OrderedDict()
+        self.ready = threading.Condition()
+
+    def offer(self, event):
+        if not self.matches(event):
+            return
+        with self.ready:
+            # A slow client only gets the newest state of each task
+            self.pending.pop(event['name'], None)
+            self.pending[event['name']] = event
+            self.ready.notify()
+
+    def take(self, timeout):
+        """Waits up to timeout for events and returns them in order (empty on timeout)."""
+        with self.ready:
+            if not self.pending:
+                self.ready.wait(timeout)
+            events = list(self.pending.values())
+            self.pending.clear()
+        return events
+
+class TaskFeed:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.latest = {} # event name -> last event sent, replayed to new streams
+        self.thread = None
+
+    def subscribe(self, app, matches):
+        """Registers a stream whose page wants events for which matches(event) is true.
+
+        Returns the subscriber (primed with the current state of matching
+        tasks), or None if this process already has TASK_STREAM_MAX streams.
+        """
+        with self.lock:
+            if len(self.subscribers) >= TASK_STREAM_MAX:
+                return None
+            subscriber = _Subscriber(matches)
+            for event in self.latest.values():
+                subscriber.offer(event)
+            self.subscribers.add(subscriber)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, args=(app,), name='task-feed', daemon=True)
+                self.thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def _run(self, app):
+        with app.app_context():
+            since = datetime.utcnow() - timedelta(seconds=TASK_STREAM_GRACE)
+            last_state = {}
+            while True:
+                with self.lock:
+                    if not self.subscribers:
+                        # Nobody is listening; the next stream starts over from the database
+                        self.thread = None
+                        self.latest.clear()
+                        return
+                try:
+                    events, since = self._poll(since, last_state)
+                except Exception as e:
+                    logger.error(f"Error reading task progress: {e}")
+                    events = []
+                now = time.time()
+                with self.lock:
+                    for event in events:
+                        self.latest[event['name']] = event
+                        for subscriber in self.subscribers:
+                            subscriber.offer(event)
+                    for name in [n for n, e in self.latest.items() if e['expires_at'] and e['expires_at'] < now]:
+                        del self.latest[name]
+                time.sleep(TASK_STREAM_INTERVAL)
+
+    def _poll(self, since, last_state):
+        """Renders an event for every task whose state changed since the last poll, plus their batches."""
+        from app import db
+        from app.routes import render_task_status, sse_event
+        from app.tasks import get_active_tasks, get_tasks_finished_since, get_batch_progress
+        from flask import render_template
+
+        # End the read transaction so we see other workers' writes
+        db.session.rollback()
+        changed = dict(get_active_tasks())
+        checked_at = datetime.utcnow()
+        changed.update(get_tasks_finished_since(since))
+
+        events = []
+        batches = {}
+        for task_id, task in changed.items():
+            state = (task['status'], task['progress'], task['message'], task.get('queue_position'))
+            if last_state.get(task_id) == state:
+                continue
+            last_state[task_id] = state
+            finished = task['status'] in ['completed', 'failed']
+            if finished:
+                last_state.pop(task_id, None)
+            scope = {'groups': {task.get('group_key')}, 'pools': {task.get('pool')}}
+            if task.get('batch_id'):
+                batch_scope = batches.setdefault(task['batch_id'], {'groups': set(), 'pools': set()})
+                batch_scope['groups'].update(scope['groups'])
+                batch_scope['pools'].update(scope['pools'])
+            events.append(dict(scope, name=f"task-{task_id}",
+                               data=sse_event(f"task-{task_id}", render_task_status(task_id, task)),
+                               expires_at=time.time() + TASK_STREAM_GRACE if finished else None))
+
+        for batch_id, scope in batches.items():
+            batch = get_batch_progress(batch_id)
+            if batch:
+                html = render_template('components/batch_progress.html', batch=batch, batch_id=batch_id)
+                events.append(dict(scope, name=f"batch-{batch_id}", data=sse_event(f"batch-{batch_id}", html),
+                                   expires_at=time.time() + TASK_STREAM_GRACE if batch['done'] else None))
+        return events, checked_at
+
+task_feed = TaskFeed()
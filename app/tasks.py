@@ -1,76 +1,800 @@
+import importlib
+import json
+import os
+import socket
 import threading
+import time
 import uuid
+from collections import deque, OrderedDict
 from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
-# Global task store
-# Format: {task_id: {'status': 'pending'|'running'|'completed'|'failed', 'progress': 0, 'message': '', 'result': None}}
-tasks = {}
-
-# Executor for background tasks
-executor = ThreadPoolExecutor(max_workers=3)
-
-def start_task(func, *args, **kwargs):
-    task_id = str(uuid.uuid4())
-    tasks[task_id] = {
-        'status': 'pending',
-        'progress': 0,
-        'message': 'Starting...',
-        'total_bytes': 0,
-        'downloaded_bytes': 0
-    }
-    
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import case, func as sa_func
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import Task, Settings, Lease
+
+# Task state lives in the `task` table so every gunicorn worker sees the same
+# progress. Progress updates are coalesced in memory and written by a single
+# flusher thread, so a yt-dlp progress_hook firing per chunk costs one UPDATE
+# per task per PROGRESS_FLUSH_INTERVAL instead of one per chunk.
+# Format: {'status': 'pending'|'running'|'completed'|'failed', 'progress': 0, 'message': '', 'result': None}
+PROGRESS_FLUSH_INTERVAL = 1.0 # seconds
+
+# Finished tasks are evicted once they are older than TASK_HISTORY_MAX_AGE
+# or fall outside the newest TASK_HISTORY_MAX_COUNT.
+TASK_HISTORY_MAX_AGE = timedelta(days=7)
+TASK_HISTORY_MAX_COUNT = 500
+TASK_PRUNE_INTERVAL = 600 # seconds
+
+# Unflushed progress updates for tasks owned by this process: {task_id: {column: value}}
+_pending_updates = {}
+_pending_lock = threading.Lock()
+# Serializes flushes with final status writes so a stale progress batch never lands after completion
+_write_lock = threading.Lock()
+_flusher_thread = None
+_app = None
+# Tasks of this process still waiting in a pool: {task_id: pool_name}
+_queued_tasks = {}
+
+# Identifies this process as the owner of the tasks it queues
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+# Resumable tasks are given up after this many starts
+MAX_TASK_ATTEMPTS = 3
+# Every process that owns tasks keeps the lease process:<PROCESS_ID> alive
+# from its flusher thread. Once it runs out the owner is gone (crashed,
+# killed on timeout, recycled by max_requests): the scheduler leader hands
+# its tasks on (recover_dead_owners) and start_task no longer dedupes onto them.
+OWNER_LEASE_TTL = 90 # seconds
+OWNER_HEARTBEAT_INTERVAL = 30 # seconds, well inside the TTL
+_resume_lock = threading.Lock()
+
+# Worker lanes for background tasks. Each lane has its own concurrency limit
+# (configurable from Settings as pool_size_<name>) so a large batch download
+# can't starve manual scans, and bookkeeping never takes a download slot.
+DEFAULT_POOL_SIZES = {
+    'scan': 4,
+    'download': 3,
+    'control': 4,
+}
+# Scans of one site at a time within the scan pool (Settings scan_limit_<site>),
+# protecting the site and, for X, the Playwright browser count
+DEFAULT_SITE_SCAN_LIMITS = {
+    'pornhub': 2,
+    'xhamster': 2,
+    'x': 1,
+}
+MAX_POOL_SIZE = 32
+POOL_SETTINGS_REFRESH = 60 # seconds between re-reading pool sizes from Settings
+
+# Queue priorities, highest first. User-initiated work always runs ahead of
+# background backlog; within a level, performers (groups) take turns.
+PRIORITY_INTERACTIVE = 0 # single download / scan clicked in the UI
+PRIORITY_BATCH = 1 # manual batch download
+PRIORITY_SCHEDULED = 2 # scheduled auto-download
+PRIORITY_RECONCILE = 3 # resumed / retried background work
+
+class TaskPool:
+    """A named executor lane with a resizable concurrency limit and a priority queue.
+
+    Queued work is kept per priority level as {group: deque}; dispatch takes
+    the highest non-empty level and round-robins between its groups, so one
+    performer's hundred auto-downloads can't delay another performer's.
+    Work may also name a site; set_site_limits() caps how much of the pool
+    one site can use, and a group waiting on its site is passed over.
+    """
+
+    def __init__(self, name, max_workers):
+        self.name = name
+        self.max_workers = max_workers
+        self._levels = {}
+        self._queued = 0
+        self._running = 0
+        self.site_limits = {}
+        self._site_running = {}
+        self._lock = threading.Lock()
+        # Threads are created lazily, so the hard cap only matters once the lane is resized up
+        self._executor = ThreadPoolExecutor(max_workers=MAX_POOL_SIZE, thread_name_prefix=f'{name}-pool')
+
+    def submit(self, fn, key=None, priority=PRIORITY_INTERACTIVE, group=None, site=None):
+        with self._lock:
+            groups = self._levels.setdefault(priority, OrderedDict())
+            groups.setdefault(group, deque()).append((key, fn, site))
+            self._queued += 1
+        self._dispatch()
+
+    def promote(self, key, priority):
+        """Moves queued work `key` up to priority if it's waiting at a lower one. Returns True if moved."""
+        with self._lock:
+            for level in sorted(p for p in self._levels if p > priority):
+                groups = self._levels[level]
+                for group, queue in groups.items():
+                    for item in queue:
+                        if item[0] == key:
+                            queue.remove(item)
+                            if not queue:
+                                del groups[group]
+                            self._levels.setdefault(priority, OrderedDict()).setdefault(group, deque()).append(item)
+                            return True
+        return False
+
+    def resize(self, max_workers):
+        with self._lock:
+            self.max_workers = max(1, min(int(max_workers), MAX_POOL_SIZE))
+        self._dispatch()
+
+    def set_site_limits(self, limits):
+        """Caps concurrent work per site ({site: limit}); sites not listed share only the pool limit."""
+        with self._lock:
+            self.site_limits = dict(limits)
+        self._dispatch()
+
+    def _site_full(self, site):
+        limit = self.site_limits.get(site)
+        return limit is not None and self._site_running.get(site, 0) >= limit
+
+    def _pop(self):
+        """Takes the next (fn, site) whose site has room, or None (lock held)."""
+        for priority in sorted(self._levels):
+            groups = self._levels[priority]
+            for group, queue in groups.items():
+                if self._site_full(queue[0][2]):
+                    continue
+                _, fn, site = queue.popleft()
+                if queue:
+                    groups.move_to_end(group)
+                else:
+                    del groups[group]
+                self._queued -= 1
+                return fn, site
+        return None
+
+    def _dispatch(self):
+        with self._lock:
+            while self._queued and self._running < self.max_workers:
+                item = self._pop()
+                if item is None:
+                    break # Everything queued is waiting on a site limit
+                fn, site = item
+                self._running += 1
+                self._site_running[site] = self._site_running.get(site, 0) + 1
+                self._executor.submit(self._run, fn, site)
+
+    def _run(self, fn, site):
+        try:
+            fn()
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._site_running[site] -= 1
+            self._dispatch()
+
+    def positions(self):
+        """Returns {key: 1-based queue position} in the order work will be dispatched."""
+        positions = {}
+        position = 0
+        with self._lock:
+            for priority in sorted(self._levels):
+                queues = list(self._levels[priority].values())
+                depth = max((len(q) for q in queues), default=0)
+                for i in range(depth):
+                    for queue in queues:
+                        if i < len(queue):
+                            position += 1
+                            key = queue[i][0]
+                            if key is not None:
+                                positions[key] = position
+        return positions
+
+pools = {name: TaskPool(name, size) for name, size in DEFAULT_POOL_SIZES.items()}
+_pools_loaded_at = 0
+
+def get_pool_size_settings():
+    """Returns {pool_name: size} from Settings, falling back to DEFAULT_POOL_SIZES."""
+    sizes = dict(DEFAULT_POOL_SIZES)
+    keys = [f'pool_size_{name}' for name in sizes]
+    for setting in Settings.query.filter(Settings.key.in_(keys)).all():
+        name = setting.key[len('pool_size_'):]
+        if setting.value and setting.value.isdigit() and int(setting.value) > 0:
+            sizes[name] = int(setting.value)
+    return sizes
+
+def get_site_scan_limits():
+    """Returns {site: limit} for the scan pool from Settings, falling back to DEFAULT_SITE_SCAN_LIMITS."""
+    limits = dict(DEFAULT_SITE_SCAN_LIMITS)
+    keys = [f'scan_limit_{site}' for site in limits]
+    for setting in Settings.query.filter(Settings.key.in_(keys)).all():
+        site = setting.key[len('scan_limit_'):]
+        if setting.value and setting.value.isdigit() and int(setting.value) > 0:
+            limits[site] = int(setting.value)
+    return limits
+
+def configure_pools(sizes=None, site_limits=None):
+    """Applies pool sizes and scan site limits (or the saved Settings) to this process's pools."""
+    global _pools_loaded_at
+    if sizes is None:
+        sizes = get_pool_size_settings()
+    if site_limits is None:
+        site_limits = get_site_scan_limits()
+    for name, size in sizes.items():
+        if name in pools:
+            pools[name].resize(size)
+    pools['scan'].set_site_limits(site_limits)
+    _pools_loaded_at = time.time()
+
+def _refresh_pools():
+    # Other workers may have saved new sizes; pick them up without a restart
+    if time.time() - _pools_loaded_at > POOL_SETTINGS_REFRESH:
+        try:
+            configure_pools()
+        except Exception as e:
+            print(f"Error loading pool sizes: {e}")
+
+def get_pool_stats():
+    """Returns running/queued counts for each pool across all workers, from the task table.
+
+    max_workers is the pool's size, which every worker process has.
+    """
+    table = Task.__table__
+    counts = {}
+    with db.engine.connect() as conn:
+        for pool, status, count in conn.execute(db.select(table.c.pool, table.c.status, sa_func.count()).where(
+                table.c.status.in_(['pending', 'running'])).group_by(table.c.pool, table.c.status)):
+            counts[(pool, status)] = count
+    return [{'name': name, 'max_workers': pool.max_workers,
+             'running': counts.get((name, 'running'), 0), 'queued': counts.get((name, 'pending'), 0)}
+            for name, pool in pools.items()]
+
+def _get_app():
+    """Returns the app used for task bookkeeping (captured on first start_task)."""
+    global _app
+    if _app is None:
+        _app = current_app._get_current_object()
+    return _app
+
+def task_app_context():
+    """App context for a task running on a pool thread, from the app that queued it.
+
+    Tasks must not build their own app with create_app(): every call adds
+    another log file handler.
+    """
+    return _get_app().app_context()
+
+def _write_task(task_id, values):
+    """Writes task columns in a short transaction of its own.
+
+    Uses the engine directly so the caller's ORM session (which may hold
+    unrelated pending changes) is never committed as a side effect.
+    """
+    values['updated_at'] = datetime.utcnow()
+    table = Task.__table__
+    with _get_app().app_context():
+        with db.engine.begin() as conn:
+            conn.execute(table.update().where(table.c.id == task_id).values(**values))
+
+def _flush_pending():
+    with _write_lock:
+        with _pending_lock:
+            if not _pending_updates:
+                return
+            batch = dict(_pending_updates)
+            _pending_updates.clear()
+
+        table = Task.__table__
+        now = datetime.utcnow()
+        try:
+            with _get_app().app_context():
+                with db.engine.begin() as conn:
+                    for task_id, values in batch.items():
+                        conn.execute(table.update().where(table.c.id == task_id).values(updated_at=now, **values))
+        except Exception as e:
+            # The database may be locked by a long write; keep the updates for the next round
+            # unless newer values arrived in the meantime.
+            print(f"Error flushing task progress: {e}")
+            with _pending_lock:
+                for task_id, values in batch.items():
+                    merged = dict(values)
+                    merged.update(_pending_updates.get(task_id, {}))
+                    _pending_updates[task_id] = merged
+
+def prune_task_history(max_age=TASK_HISTORY_MAX_AGE, max_count=TASK_HISTORY_MAX_COUNT):
+    """Deletes finished tasks older than max_age or beyond the newest max_count."""
+    table = Task.__table__
+    finished = table.c.status.in_(['completed', 'failed'])
+    keep = (db.select(table.c.id).where(finished)
+            .order_by(table.c.finished_at.desc()).limit(max_count).scalar_subquery())
+    with _get_app().app_context():
+        with db.engine.begin() as conn:
+            by_age = conn.execute(table.delete().where(finished, table.c.finished_at < datetime.utcnow() - max_age))
+            by_count = conn.execute(table.delete().where(finished, table.c.id.not_in(keep)))
+    return by_age.rowcount + by_count.rowcount
+
+def _owner_lease(owner):
+    return f'process:{owner}'[:64]
+
+def _renew_owner_lease():
+    from app.leader import acquire_lease
+    try:
+        with _get_app().app_context():
+            acquire_lease(_owner_lease(PROCESS_ID), PROCESS_ID, OWNER_LEASE_TTL)
+    except Exception as e:
+        print(f"Error renewing task owner lease: {e}")
+
+def _flusher():
+    last_prune = 0
+    last_heartbeat = time.time()
+    while True:
+        time.sleep(PROGRESS_FLUSH_INTERVAL)
+        _flush_pending()
+        if time.time() - last_heartbeat > OWNER_HEARTBEAT_INTERVAL:
+            last_heartbeat = time.time()
+            _renew_owner_lease()
+        if time.time() - last_prune > TASK_PRUNE_INTERVAL:
+            last_prune = time.time()
+            try:
+                pruned = prune_task_history()
+                if pruned:
+                    print(f"Pruned {pruned} finished tasks from history.")
+            except Exception as e:
+                print(f"Error pruning task history: {e}")
+
+def _ensure_flusher():
+    global _flusher_thread
+    with _pending_lock:
+        if _flusher_thread is None:
+            # Take the lease before this process's first task row exists, so it is never mistaken for dead
+            _renew_owner_lease()
+            _flusher_thread = threading.Thread(target=_flusher, name='task-progress-flusher', daemon=True)
+            _flusher_thread.start()
+
+def _finish_task(task_id, values):
+    """Drops any buffered progress for task_id and writes its final state."""
+    with _write_lock:
+        with _pending_lock:
+            buffered = _pending_updates.pop(task_id, {})
+        buffered.update(values)
+        _write_task(task_id, buffered)
+
+def _insert_task(name, status='pending', message='Starting...', batch=None, dedupe_key=None, queue=None):
+    """Inserts a task row and returns (task_id, created).
+
+    When another task with the same dedupe_key is still pending or running
+    (in any worker), nothing is inserted and that task's id is returned with
+    created=False. queue holds the persisted queue columns (func, args,
+    pool, priority, group_key) for resumable tasks.
+    """
+    _get_app()
+    _ensure_flusher()
+    table = Task.__table__
+
+    for _ in range(3):
+        task_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(table.insert().values(
+                    id=task_id,
+                    name=name,
+                    status=status,
+                    progress=0,
+                    message=message,
+                    total_bytes=0,
+                    downloaded_bytes=0,
+                    batch_id=batch.id if batch else None,
+                    dedupe_key=dedupe_key,
+                    attempts=1 if status == 'running' else 0,
+                    owner=PROCESS_ID,
+                    created_at=now,
+                    started_at=now if status == 'running' else None,
+                    updated_at=now,
+                    **(queue or {})
+                ))
+            return task_id, True
+        except IntegrityError:
+            if not dedupe_key:
+                raise
+            with db.engine.begin() as conn:
+                existing = conn.execute(db.select(table.c.id, table.c.owner).where(
+                    table.c.dedupe_key == dedupe_key,
+                    table.c.status.in_(['pending', 'running'])
+                )).first()
+                if existing and not _owner_alive(conn, existing.owner):
+                    # Left behind by a dead worker: fail it and take the key over
+                    print(f"Task {existing.id} ({dedupe_key}) belongs to a dead worker; replacing it.")
+                    conn.execute(table.update().where(table.c.id == existing.id, table.c.owner == existing.owner).values(
+                        status='failed', message='Interrupted: worker stopped', finished_at=now, updated_at=now))
+                    continue
+            if existing:
+                return existing.id, False
+            # The other task finished in between; try again
+
+    raise RuntimeError(f"Could not register task for {dedupe_key}")
+
+def _func_path(func):
+    return f"{func.__module__}:{func.__qualname__}"
+
+def _load_func(path):
+    module_name, _, qualname = path.partition(':')
+    obj = importlib.import_module(module_name)
+    for part in qualname.split('.'):
+        obj = getattr(obj, part)
+    return obj
+
+def _submit(task_id, func, args, kwargs, pool, priority, group, batch=None, site=None):
+    """Queues an already recorded task on its pool."""
     def task_wrapper():
+        _queued_tasks.pop(task_id, None)
         try:
-            tasks[task_id]['status'] = 'running'
+            _write_task(task_id, {
+                'status': 'running',
+                'started_at': datetime.utcnow(),
+                'attempts': Task.__table__.c.attempts + 1
+            })
             result = func(task_id, *args, **kwargs)
-            tasks[task_id]['status'] = 'completed'
-            tasks[task_id]['progress'] = 100
-            tasks[task_id]['result'] = result
+            _finish_task(task_id, {
+                'status': 'completed',
+                'progress': 100,
+                'result': json.dumps(result, default=str) if result is not None else None,
+                'finished_at': datetime.utcnow()
+            })
         except Exception as e:
-            tasks[task_id]['status'] = 'failed'
-            tasks[task_id]['message'] = str(e)
-            
-    executor.submit(task_wrapper)
+            _finish_task(task_id, {'status': 'failed', 'message': str(e), 'finished_at': datetime.utcnow()})
+        finally:
+            if batch:
+                batch._task_finished(task_id)
+
+    if batch:
+        batch._add(task_id)
+    _queued_tasks[task_id] = pool
+    pools[pool].submit(task_wrapper, key=task_id, priority=priority, group=group, site=site)
+
+def _promote_task(task_id, priority):
+    """Raises a still-queued task to priority, e.g. a user clicking download on an auto-download."""
+    table = Task.__table__
+    with db.engine.begin() as conn:
+        conn.execute(table.update().where(
+            table.c.id == task_id, table.c.status == 'pending', table.c.priority > priority
+        ).values(priority=priority))
+    pool = _queued_tasks.get(task_id)
+    if pool and pools[pool].promote(task_id, priority):
+        print(f"Task {task_id} promoted to priority {priority}.")
+
+def _upgrade_task(task_id, upgrade):
+    """Merges upgrade into the stored kwargs of a task that has not started yet; False once it is running."""
+    table = Task.__table__
+    with db.engine.begin() as conn:
+        stored = conn.execute(db.select(table.c.args).where(table.c.id == task_id, table.c.status == 'pending')).first()
+        if stored is None:
+            return False
+        call = json.loads(stored.args) if stored.args else {'args': [], 'kwargs': {}}
+        call['kwargs'].update(upgrade)
+        # The task is marked running before it reads task_kwargs(), so this either lands first or not at all
+        return conn.execute(table.update().where(table.c.id == task_id, table.c.status == 'pending').values(
+            args=json.dumps(call))).rowcount > 0
+
+def task_kwargs(task_id):
+    """The kwargs stored in a task's row: its resume arguments, plus any upgrade from a deduped start_task()."""
+    table = Task.__table__
+    with _get_app().app_context():
+        with db.engine.connect() as conn:
+            stored = conn.execute(db.select(table.c.args).where(table.c.id == task_id)).scalar()
+    return json.loads(stored)['kwargs'] if stored else {}
+
+def start_task(func, *args, pool='download', batch=None, priority=PRIORITY_INTERACTIVE, group=None, site=None,
+               dedupe_key=None, resumable=False, upgrade=None, **kwargs):
+    """Records a task and queues func(task_id, *args, **kwargs) on the named pool.
+
+    priority is one of the PRIORITY_* levels; group (usually the performer id)
+    is the unit of fair scheduling within a level, and site (for scans) counts
+    towards that site's limit in the pool. If batch is given, the
+    task is counted towards that Batch's completion. If dedupe_key (e.g.
+    'download:<video_id>') matches a task that is still in flight, no new
+    work is started and the existing task_id is returned; if it is still
+    queued at a lower priority it is promoted (in its pool when it was
+    queued by this process, and in the task row for resumes). Resumable tasks
+    (module-level func, JSON-serializable arguments) are re-queued after a
+    restart by resume_orphaned_tasks().
+
+    upgrade is a dict of JSON-serializable kwargs that must not be lost to
+    dedupe (e.g. a deep scan requested while a shallow one is queued): they
+    are stored in the task row, merged into the existing task if it has not
+    started yet, and func reads them back with task_kwargs(task_id). Compare
+    task_kwargs() with upgrade afterwards to see whether they took.
+    """
+    _refresh_pools()
+    queue = {'pool': pool, 'priority': priority, 'group_key': str(group) if group is not None else None}
+    if resumable:
+        queue['func'] = _func_path(func)
+        queue['args'] = json.dumps({'args': list(args), 'kwargs': dict(kwargs, **(upgrade or {}))})
+    elif upgrade:
+        queue['args'] = json.dumps({'args': [], 'kwargs': upgrade})
+    task_id, created = _insert_task(getattr(func, '__name__', None), batch=batch, dedupe_key=dedupe_key, queue=queue)
+    if not created:
+        print(f"Task {dedupe_key} already in flight ({task_id}); attaching.")
+        _promote_task(task_id, priority)
+        if upgrade and not _upgrade_task(task_id, upgrade):
+            print(f"Task {task_id} already started; could not apply {upgrade}.")
+        return task_id
+
+    _submit(task_id, func, args, kwargs, pool, priority, group, batch, site)
     return task_id
 
+def _owner_alive(conn, owner):
+    """True if owner still holds its lease (an unowned task is waiting to be resumed, so counts as alive)."""
+    if owner is None or owner == PROCESS_ID:
+        return True
+    lease = Lease.__table__
+    return conn.execute(db.select(lease.c.name).where(
+        lease.c.name == _owner_lease(owner), lease.c.owner == owner, lease.c.expires_at > datetime.utcnow()
+    )).first() is not None
+
+def _release_tasks(conn, owned, message, now):
+    """Re-queues the in-flight resumable tasks matching `owned` (unowned, for resume_orphaned_tasks) and fails the rest."""
+    table = Task.__table__
+    in_flight = table.c.status.in_(['pending', 'running'])
+    requeued = conn.execute(table.update().where(
+        owned, in_flight, table.c.func.is_not(None), table.c.attempts < MAX_TASK_ATTEMPTS
+    ).values(status='pending', owner=None, message='Waiting to resume...', updated_at=now)).rowcount
+    failed = conn.execute(table.update().where(owned, in_flight, table.c.owner.is_not(None)).values(
+        status='failed', message=message, finished_at=now, updated_at=now
+    )).rowcount
+    return requeued, failed
+
+def recover_tasks():
+    """Marks work left behind by dead processes as orphaned.
+
+    Must run while no worker is up (see entrypoint.sh). Pending/running
+    resumable tasks go back to 'pending' with no owner, for the scheduler leader
+    to claim in resume_orphaned_tasks(); everything else is failed.
+    Returns (requeued, failed) counts.
+    """
+    with db.engine.begin() as conn:
+        return _release_tasks(conn, db.true(), 'Interrupted by restart', datetime.utcnow())
+
+def recover_dead_owners():
+    """Does what recover_tasks() does, while the app runs, for owners whose lease has expired.
+
+    Called from the leader heartbeat, so a worker that dies mid-download
+    doesn't leave its tasks 'running' until the next container restart.
+    Returns (requeued, failed) counts.
+    """
+    table = Task.__table__
+    lease = Lease.__table__
+    now = datetime.utcnow()
+    with db.engine.begin() as conn:
+        owners = set(conn.execute(db.select(table.c.owner).where(
+            table.c.status.in_(['pending', 'running']), table.c.owner.is_not(None)).distinct()).scalars())
+        dead = [owner for owner in owners if not _owner_alive(conn, owner)]
+        counts = _release_tasks(conn, table.c.owner.in_(dead), 'Interrupted: worker stopped', now) if dead else (0, 0)
+        # Leases of processes that are long gone
+        conn.execute(lease.delete().where(lease.c.name.like('process:%'), lease.c.expires_at < now - timedelta(days=1)))
+    if dead:
+        print(f"Recovered tasks of {len(dead)} dead worker(s): {counts[0]} to resume, {counts[1]} failed.")
+    return counts
+
+def resume_orphaned_tasks():
+    """Claims orphaned resumable tasks for this process and queues them again.
+
+    Called from the leader heartbeat. Rows are claimed with a single UPDATE,
+    so even if leadership changes hands each task is resumed by exactly one
+    process.
+    """
+    _get_app()
+    _ensure_flusher()
+    table = Task.__table__
+    # Tag this round's claim so tasks this process queued itself are never picked up
+    claim = f'{PROCESS_ID}:resume'
+    with _resume_lock, db.engine.begin() as conn:
+        conn.execute(table.update().where(
+            table.c.owner.is_(None), table.c.status == 'pending', table.c.func.is_not(None)
+        ).values(owner=claim, updated_at=datetime.utcnow()))
+        rows = conn.execute(db.select(table).where(table.c.owner == claim)
+                            .order_by(table.c.created_at)).mappings().all()
+        conn.execute(table.update().where(table.c.owner == claim).values(owner=PROCESS_ID))
+
+    resumed = 0
+    for row in rows:
+        try:
+            func = _load_func(row['func'])
+            payload = json.loads(row['args'] or '{}')
+        except Exception as e:
+            _finish_task(row['id'], {'status': 'failed', 'message': f"Cannot resume: {e}", 'finished_at': datetime.utcnow()})
+            continue
+        _submit(row['id'], func, payload.get('args', []), payload.get('kwargs', {}),
+                row['pool'] if row['pool'] in pools else 'download', PRIORITY_RECONCILE, row['group_key'])
+        resumed += 1
+
+    if resumed:
+        print(f"Resumed {resumed} interrupted tasks.")
+    return resumed
+
+def _queue_positions():
+    """Returns {task_id: position in its pool} for tasks queued in this process."""
+    positions = {}
+    for name in set(_queued_tasks.values()):
+        positions.update(pools[name].positions())
+    return positions
+
 def get_task_progress(task_id):
-    return tasks.get(task_id)
-
-def update_task_progress(task_id, progress=None, message=None, total_bytes=None, downloaded_bytes=None):
-    if task_id in tasks:
-        if progress is not None:
-            tasks[task_id]['progress'] = progress
-        if message is not None:
-            tasks[task_id]['message'] = message
-        if total_bytes is not None:
-            tasks[task_id]['total_bytes'] = total_bytes
-        if downloaded_bytes is not None:
-            tasks[task_id]['downloaded_bytes'] = downloaded_bytes
-
-def monitor_batch_completion(task_ids, callback):
+    task = Task.query.get(task_id)
+    if not task:
+        return None
+    data = task.to_dict()
+    # Overlay updates this process has not flushed yet
+    with _pending_lock:
+        data.update(_pending_updates.get(task_id, {}))
+    pool = _queued_tasks.get(task_id)
+    if pool:
+        data['queue_position'] = pools[pool].positions().get(task_id)
+    return data
+
+def update_task_progress(task_id, progress=None, message=None, total_bytes=None, downloaded_bytes=None, status=None):
+    values = {}
+    if progress is not None:
+        values['progress'] = progress
+    if message is not None:
+        values['message'] = message
+    if total_bytes is not None:
+        values['total_bytes'] = total_bytes
+    if downloaded_bytes is not None:
+        values['downloaded_bytes'] = downloaded_bytes
+    if status is not None:
+        values['status'] = status
+    if not values:
+        return
+
+    with _pending_lock:
+        _pending_updates.setdefault(task_id, {}).update(values)
+
+def get_active_tasks():
+    """Returns {task_id: task_dict} for pending and running tasks, oldest first."""
+    active = Task.query.filter(Task.status.in_(['pending', 'running'])).order_by(Task.created_at).all()
+    positions = _queue_positions()
+    result = {}
+    with _pending_lock:
+        for t in active:
+            data = t.to_dict()
+            data.update(_pending_updates.get(t.id, {}))
+            if t.id in positions:
+                data['queue_position'] = positions[t.id]
+            result[t.id] = data
+    return result
+
+def get_tasks_finished_since(since):
+    """Returns {task_id: task_dict} for tasks that finished at or after `since`."""
+    finished = (Task.query.filter(Task.status.in_(['completed', 'failed']), Task.finished_at >= since)
+                .order_by(Task.finished_at).all())
+    return {t.id: t.to_dict() for t in finished}
+
+def get_recent_tasks(limit=5):
+    """Returns {task_id: task_dict} for the most recently finished tasks, newest first."""
+    finished = (Task.query.filter(Task.status.in_(['completed', 'failed']))
+                .order_by(Task.finished_at.desc()).limit(limit).all())
+    return {t.id: t.to_dict() for t in finished}
+
+# Batches started by this process that are still running: {batch_id: Batch}
+batches = {}
+_batches_lock = threading.Lock()
+
+class Batch:
+    """A group of tasks whose callback fires as soon as the last one finishes.
+
+    Tasks report completion to the batch directly from their wrapper, so
+    nothing polls and no thread is held while the batch drains. Usage:
+
+        batch = Batch(callback)
+        for vid in video_ids:
+            start_task(download_video, vid, batch=batch)
+        batch.seal()
     """
-    Monitors a list of task_ids in a background thread.
-    Executes callback() when all tasks are completed (or failed).
+
+    def __init__(self, callback=None):
+        self.id = str(uuid.uuid4())
+        self.callback = callback
+        self.task_ids = []
+        self.done = threading.Event()
+        self._remaining = 0
+        self._sealed = False
+        self._lock = threading.Lock()
+        with _batches_lock:
+            batches[self.id] = self
+
+    def _add(self, task_id):
+        with self._lock:
+            if self._sealed:
+                raise RuntimeError("Cannot add tasks to a sealed batch")
+            self.task_ids.append(task_id)
+            self._remaining += 1
+
+    def _task_finished(self, task_id):
+        with self._lock:
+            self._remaining -= 1
+            fire = self._sealed and self._remaining == 0
+        if fire:
+            self._complete()
+
+    def seal(self):
+        """Marks the batch as fully populated; fires immediately if everything already finished."""
+        with self._lock:
+            self._sealed = True
+            fire = self._remaining == 0
+        if fire:
+            self._complete()
+        return self
+
+    def _complete(self):
+        with _batches_lock:
+            batches.pop(self.id, None)
+        self.done.set()
+        print(f"Batch {self.id} finished ({len(self.task_ids)} tasks).")
+        if self.callback:
+            # Run on the control lane so the finishing download slot is released right away
+            pools['control'].submit(self._run_callback)
+
+    def _run_callback(self):
+        try:
+            with _get_app().app_context():
+                self.callback()
+        except Exception as e:
+            print(f"Error in batch callback: {e}")
+
+    def progress(self):
+        return get_batch_progress(self.id)
+
+def get_batch_progress(batch_id):
+    """Aggregates the tasks of a batch (works from any worker).
+
+    Returns None for unknown batches, otherwise a dict with task counts,
+    overall progress (0-100) and summed byte counters. Like the task bars, it
+    includes this process's unflushed updates; other workers' tasks lag by
+    up to PROGRESS_FLUSH_INTERVAL.
     """
-    def monitor():
-        import time
-        print(f"Monitoring batch of {len(task_ids)} tasks...")
-        while True:
-            all_done = True
-            for tid in task_ids:
-                task = tasks.get(tid)
-                if not task or task['status'] in ['pending', 'running']:
-                    all_done = False
-                    break
-            
-            if all_done:
-                if callback:
-                    try:
-                        callback()
-                    except Exception as e:
-                        print(f"Error in batch callback: {e}")
-                break
-            
-            time.sleep(2)
-            
-    executor.submit(monitor)
+    finished = case((Task.status.in_(['completed', 'failed']), 1), else_=0)
+    failed = case((Task.status == 'failed', 1), else_=0)
+    row = db.session.query(
+        sa_func.count(Task.id),
+        sa_func.sum(finished),
+        sa_func.sum(failed),
+        sa_func.sum(case((Task.status.in_(['completed', 'failed']), 100), else_=Task.progress)),
+        sa_func.sum(Task.total_bytes),
+        sa_func.sum(Task.downloaded_bytes)
+    ).filter(Task.batch_id == batch_id).one()
+
+    total = row[0] or 0
+    if total == 0:
+        return None
+    finished_count = int(row[1] or 0)
+    sums = {'progress': row[3] or 0, 'total_bytes': row[4] or 0, 'downloaded_bytes': row[5] or 0}
+
+    # Overlay updates this process has not flushed yet, so the batch bar keeps up with its task bars
+    with _pending_lock:
+        buffered = {task_id: dict(values) for task_id, values in _pending_updates.items()}
+    if buffered:
+        stored = db.session.query(Task.id, Task.progress, Task.total_bytes, Task.downloaded_bytes).filter(
+            Task.batch_id == batch_id, Task.id.in_(list(buffered)), Task.status.notin_(['completed', 'failed']))
+        for task_id, *values in stored:
+            for column, value in zip(sums, values):
+                if buffered[task_id].get(column) is not None:
+                    sums[column] += buffered[task_id][column] - (value or 0)
+
+    return {
+        'id': batch_id,
+        'total': total,
+        'finished': finished_count,
+        'failed': int(row[2] or 0),
+        'done': finished_count == total,
+        'progress': round(sums['progress'] / total, 1),
+        'total_bytes': int(sums['total_bytes']),
+        'downloaded_bytes': int(sums['downloaded_bytes'])
+    }
+
+tasks_cli = AppGroup('tasks', help='Background task queue maintenance.')
+
+@tasks_cli.command('recover')
+def recover_tasks_command():
+    """Re-queue downloads interrupted by a restart (run before starting workers)."""
+    requeued, failed = recover_tasks()
+    print(f"Task recovery: {requeued} to resume, {failed} marked as failed.")
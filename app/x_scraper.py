@@ -150,7 +150,10 @@ def extract_videos_from_json(data, video_links, username):
 
     traverse(data)
 
-def scrape_x_videos(username, task_id=None, use_cookies=False):
+def scrape_x_videos(username, task_id=None, use_cookies=False, max_scrolls=None, known_viewkeys=None,
+                    stop_after_known_rounds=1):
+    # max_scrolls limits the scroll rounds (None scrolls to the end of the media grid).
+    # With known_viewkeys (tweet ids), stop once stop_after_known_rounds rounds turn up nothing new.
     # Default cookie file location
     cookie_file = "cookies.txt" 
     
@@ -241,6 +244,9 @@ def scrape_x_videos(username, task_id=None, use_cookies=False):
             last_height = page.evaluate("document.body.scrollHeight")
             retries = 0
             max_retries = 3
+            scroll_rounds = 0
+            known_rounds = 0
+            unknown_seen = 0
             
             if task_id:
                 update_task_progress(task_id, message="Scanning...")
@@ -283,6 +289,17 @@ def scrape_x_videos(username, task_id=None, use_cookies=False):
                                         'source': 'dom'
                                     }
                 
+                if known_viewkeys is not None and video_links:
+                    unknown_now = sum(1 for tweet_id in video_links if tweet_id not in known_viewkeys)
+                    known_rounds = known_rounds + 1 if unknown_now == unknown_seen else 0
+                    unknown_seen = unknown_now
+                    if known_rounds >= stop_after_known_rounds:
+                        logger.info("No new videos in the last scroll window; stopping.")
+                        break
+                if max_scrolls is not None and scroll_rounds >= max_scrolls:
+                    break
+                scroll_rounds += 1
+
                 # 2. Scroll
                 for _ in range(5):
                     page.keyboard.press("PageDown")
@@ -8,8 +8,14 @@ set -e
 # But if migrations folder is missing, we might need 'flask db init' etc.
 # Assuming migrations folder is committed in repo.
 
+# One-off CLI processes load the app too; keep them out of the scheduler
+# election so they don't take the lease from the server that follows
 echo "Running database migrations..."
-uv run flask db upgrade
+SIPHON_SCHEDULER=off uv run flask db upgrade
+
+# Downloads interrupted by the last shutdown are re-queued by the scheduler leader
+echo "Recovering interrupted tasks..."
+SIPHON_SCHEDULER=off uv run flask tasks recover
 
 # Start the application
 echo "Starting Siphon..."
@@ -1,11 +1,14 @@
 from app import create_app, db
-from app.models import Performer, Video, Settings
+from app.models import Performer, Video, Settings, Task, Lease, StashScene
 
 app = create_app()
 
 @app.shell_context_processor
 def make_shell_context():
-    return {'db': db, 'Performer': Performer, 'Video': Video, 'Settings': Settings}
+    return {'db': db, 'Performer': Performer, 'Video': Video, 'Settings': Settings, 'Task': Task, 'Lease': Lease, 'StashScene': StashScene}
 
 if __name__ == '__main__':
+    from app.tasks import recover_tasks
+    with app.app_context():
+        recover_tasks()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,77 @@
+"""Compare listing-page parsing before/after the strained parser.
+
+Usage:
+    uv run python scripts/bench_parsers.py pornhub page1.html [page2.html ...]
+    uv run python scripts/bench_parsers.py xhamster page1.html --repeat 50
+
+Use the offline corpus in scripts/fixtures/ or pages saved from a browser
+("Save page as... HTML only") or with curl. For each
+page it reports CPU ms per parse and tracemalloc peak memory for the old full
+html.parser parse and for app.scraper's parse_*_listing.
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+import app.scraper
+from app.scraper import parse_pornhub_listing, parse_xhamster_listing
+
+def legacy_pornhub(html):
+    # What scrape_pornhub_videos did before: full tree, then select
+    soup = BeautifulSoup(html, 'html.parser')
+    items = soup.select('ul#videoCategory li.videoBox')
+    if not items:
+        items = soup.select('.videoUList .videoBox')
+    return items
+
+def legacy_xhamster(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    return soup.select('div.thumb-list__item a.video-thumb-info__name')
+
+PARSERS = {
+    'pornhub': (legacy_pornhub, parse_pornhub_listing),
+    'xhamster': (legacy_xhamster, parse_xhamster_listing),
+}
+
+def measure(func, html, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        result = func(html)
+    cpu_ms = (time.process_time() - start) * 1000 / repeat
+
+    tracemalloc.start()
+    func(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cpu_ms, peak, len(result)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('site', choices=PARSERS)
+    parser.add_argument('pages', nargs='+')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--backend', choices=['lxml', 'html.parser'],
+                        help="bs4 tree builder for the new parse (default: lxml if installed)")
+    args = parser.parse_args()
+    if args.backend:
+        app.scraper.HTML_PARSER = args.backend
+
+    legacy, current = PARSERS[args.site]
+    print(f"parser backend: {app.scraper.HTML_PARSER}")
+    print(f"{'page':40} {'KB':>6} | {'old ms':>8} {'old MB':>7} {'items':>5} | {'new ms':>8} {'new MB':>7} {'items':>5}")
+    for path in args.pages:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            html = f.read()
+        old_ms, old_peak, old_items = measure(legacy, html, args.repeat)
+        new_ms, new_peak, new_items = measure(current, html, args.repeat)
+        print(f"{os.path.basename(path)[:40]:40} {len(html) / 1024:6.0f} | "
+              f"{old_ms:8.1f} {old_peak / 1048576:7.1f} {old_items:5} | "
+              f"{new_ms:8.1f} {new_peak / 1048576:7.1f} {new_items:5}")
+
+if __name__ == '__main__':
+    main()
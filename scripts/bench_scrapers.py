@@ -0,0 +1,122 @@
+"""Benchmarks the site extractors on the offline fixture corpus.
+
+Feeds every fixture in scripts/fixtures/ through the extraction code used by
+the scanners (app.scraper.parse_*_listing, app.x_scraper.extract_videos_from_json)
+and reports ms/page, items/sec and peak allocation. Results are written as
+JSON so a later run can be compared against a saved baseline.
+
+Usage:
+    uv run python scripts/bench_scrapers.py                       # run, write bench_results/latest.json
+    uv run python scripts/bench_scrapers.py --save-baseline       # also store as bench_results/baseline.json
+    uv run python scripts/bench_scrapers.py --compare bench_results/baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(SCRIPTS_DIR))
+
+from app.scraper import parse_pornhub_listing, parse_xhamster_listing, HTML_PARSER
+from app.x_scraper import extract_videos_from_json
+
+FIXTURE_DIR = os.path.join(SCRIPTS_DIR, 'fixtures')
+RESULTS_DIR = os.path.join(SCRIPTS_DIR, 'bench_results')
+
+def _x_timeline(text):
+    video_links = {}
+    extract_videos_from_json(json.loads(text), video_links, 'fixture_user')
+    return video_links
+
+# fixture file -> extractor taking the raw file text and returning the items found
+CASES = {
+    'pornhub_model.html': parse_pornhub_listing,
+    'pornhub_pornstar.html': parse_pornhub_listing,
+    'xhamster_creator.html': parse_xhamster_listing,
+    'xhamster_pornstar.html': parse_xhamster_listing,
+    'x_user_media.json': _x_timeline,
+}
+
+def run_case(extract, text, repeat):
+    extract(text) # Warm up imports and caches
+
+    start = time.process_time()
+    for _ in range(repeat):
+        items = extract(text)
+    cpu = time.process_time() - start
+
+    tracemalloc.start()
+    extract(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'items': len(items),
+        'ms_per_page': round(cpu * 1000 / repeat, 3),
+        'items_per_sec': round(len(items) * repeat / cpu, 1) if cpu else None,
+        'peak_alloc_kb': round(peak / 1024, 1),
+        'page_kb': round(len(text) / 1024, 1),
+    }
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPTS_DIR, text=True).strip()
+    except Exception:
+        return None
+
+def print_results(results, baseline=None):
+    base = (baseline or {}).get('results', {})
+    print(f"{'fixture':26} {'items':>5} {'ms/page':>9} {'items/s':>10} {'peak KB':>9}" + ("   vs baseline" if base else ''))
+    for name, r in results.items():
+        line = f"{name:26} {r['items']:5} {r['ms_per_page']:9.3f} {r['items_per_sec'] or 0:10.0f} {r['peak_alloc_kb']:9.1f}"
+        if name in base:
+            b = base[name]
+            line += f"   {100 * (r['ms_per_page'] / b['ms_per_page'] - 1):+6.1f}% time"
+            line += f" {100 * (r['peak_alloc_kb'] / b['peak_alloc_kb'] - 1):+6.1f}% mem"
+            if r['items'] != b['items']:
+                line += f"  ITEMS CHANGED ({b['items']} -> {r['items']})"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--out', default=os.path.join(RESULTS_DIR, 'latest.json'))
+    parser.add_argument('--compare', help='baseline JSON to compare against')
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+
+    results = {}
+    for name, extract in CASES.items():
+        with open(os.path.join(FIXTURE_DIR, name), encoding='utf-8') as f:
+            results[name] = run_case(extract, f.read(), args.repeat)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'git': git_revision(),
+        'python': platform.python_version(),
+        'html_parser': HTML_PARSER,
+        'repeat': args.repeat,
+        'results': results,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    paths = [args.out] + ([os.path.join(RESULTS_DIR, 'baseline.json')] if args.save_baseline else [])
+    for path in paths:
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {path}")
+
+if __name__ == '__main__':
+    main()
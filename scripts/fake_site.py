@@ -0,0 +1,153 @@
+"""Local stand-in for the pornhub and xHamster listing pages.
+
+Serves synthetic listings (listing_pages.py) for any performer id under the
+same paths the scrapers request, so scans can run offline against hundreds of
+performers. Point the app at it with:
+
+    PORNHUB_BASE_URL=http://127.0.0.1:8800 XHAMSTER_BASE_URL=http://127.0.0.1:8800
+
+Each performer gets a deterministic catalogue (--videos, +/- 50%) that grows by
+--uploads-per-hour while the server runs, so incremental scans find new
+videos. --latency, --error-rate and --throttle-rate inject slowness, 500s
+and 429s (with Retry-After). Responses carry an ETag and honour If-None-Match.
+
+Usage:
+    uv run python scripts/fake_site.py --port 8800 --videos 2000 --latency 150 --throttle-rate 0.02
+"""
+import argparse
+import functools
+import hashlib
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from listing_pages import make_videos, render_pornhub_page, render_xhamster_page
+
+ROUTES = [
+    (re.compile(r'^/model/([^/]+)/videos$'), 'pornhub', 'model'),
+    (re.compile(r'^/pornstar/([^/]+)/videos/upload$'), 'pornhub', 'pornstar'),
+    (re.compile(r'^/creators/([^/]+)/newest(?:/(\d+))?$'), 'xhamster', 'creator'),
+    (re.compile(r'^/pornstars/([^/]+)/exclusive(?:/(\d+))?$'), 'xhamster', 'pornstar'),
+]
+
+class FakeSite:
+    def __init__(self, args):
+        self.args = args
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.counts = {'requests': 0, 'ok': 0, 'not_modified': 0, 'errors': 0, 'throttled': 0, 'not_found': 0}
+
+    def count(self, key):
+        with self.lock:
+            self.counts['requests'] += 1
+            self.counts[key] += 1
+
+    def catalogue(self, site, performer_id):
+        """All of a performer's videos, newest first, including uploads since the server started."""
+        seed = zlib.crc32(f'{site}:{performer_id}'.encode())
+        base = int(self.args.videos * random.Random(seed).uniform(0.5, 1.5))
+        uploaded = int((time.time() - self.started) / 3600 * self.args.uploads_per_hour)
+        return _catalogue(site, seed, base + uploaded)
+
+@functools.lru_cache(maxsize=1024)
+def _catalogue(site, seed, count):
+    prefix = 'ph' if site == 'pornhub' else 'xh'
+    # make_videos numbers oldest first; reverse so fresh uploads appear at the top
+    return list(reversed(make_videos(seed % 100000, count, prefix)))
+
+class Handler(BaseHTTPRequestHandler):
+    site = None # FakeSite, set in main()
+
+    def log_message(self, format, *args):
+        if self.site.args.verbose:
+            super().log_message(format, *args)
+
+    def send_body(self, status, body, headers=None):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        args = self.site.args
+        if args.latency:
+            time.sleep(max(0, random.gauss(args.latency, args.latency / 4)) / 1000)
+        if random.random() < args.throttle_rate:
+            self.site.count('throttled')
+            return self.send_body(429, 'Too Many Requests', {'Retry-After': str(args.retry_after)})
+        if random.random() < args.error_rate:
+            self.site.count('errors')
+            return self.send_body(500, 'Internal Server Error')
+
+        parsed = urlparse(self.path)
+        for pattern, site_name, layout in ROUTES:
+            match = pattern.match(parsed.path)
+            if match:
+                break
+        else:
+            self.site.count('not_found')
+            return self.send_body(404, 'Not Found')
+
+        performer_id = match.group(1)
+        if site_name == 'pornhub':
+            page = int(parse_qs(parsed.query).get('page', ['1'])[0])
+        else:
+            page = int(match.group(2) or 1)
+
+        videos = self.site.catalogue(site_name, performer_id)
+        chunk = videos[(page - 1) * args.page_size:page * args.page_size]
+        if not chunk and site_name == 'xhamster':
+            self.site.count('not_found')
+            return self.send_body(404, 'Not Found')
+
+        if site_name == 'pornhub':
+            body = render_pornhub_page(chunk, layout=layout, filler=args.filler, seed=page)
+        else:
+            body = render_xhamster_page(chunk, base=f'http://{self.headers.get("Host")}', layout=layout,
+                                        filler=args.filler, seed=page)
+
+        etag = '"' + hashlib.sha1(body.encode()).hexdigest()[:16] + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.site.count('not_modified')
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.site.count('ok')
+        self.send_body(200, body, {'ETag': etag})
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--videos', type=int, default=1000, help='average catalogue size per performer')
+    parser.add_argument('--page-size', type=int, default=40)
+    parser.add_argument('--uploads-per-hour', type=float, default=0)
+    parser.add_argument('--latency', type=float, default=0, help='mean response latency in ms')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of requests answered with 500')
+    parser.add_argument('--throttle-rate', type=float, default=0, help='fraction of requests answered with 429')
+    parser.add_argument('--retry-after', type=int, default=2, help='Retry-After seconds sent with 429s')
+    parser.add_argument('--filler', type=int, default=10, help='blocks of unrelated markup per page')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    Handler.site = FakeSite(args)
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"Serving fake listings on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(Handler.site.counts)
+
+if __name__ == '__main__':
+    main()
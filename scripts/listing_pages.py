@@ -0,0 +1,119 @@
+"""Synthetic pages shaped like the listings the scrapers read.
+
+Used by make_fixtures.py (offline fixture corpus) and fake_site.py. The markup
+mirrors only what app.scraper and app.x_scraper look at (container ids,
+item classes, title links, duration badges, GraphQL tweet objects) plus
+enough unrelated markup around it to make page weight and parse cost
+realistic. Output is deterministic for a given seed.
+"""
+import json
+import random
+from datetime import datetime, timedelta
+
+WORDS = ('amateur', 'behind', 'scenes', 'compilation', 'exclusive', 'full', 'hd', 'home', 'late', 'night', 'new',
+         'outdoor', 'part', 'pov', 'premium', 'quick', 'session', 'special', 'summer', 'teaser', 'vlog', 'weekend')
+
+def video_title(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 8))).capitalize()
+
+def video_duration(rng):
+    seconds = rng.randint(60, 3600)
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+def make_videos(seed, count, prefix):
+    """Returns [{'viewkey', 'title', 'duration'}], newest first."""
+    rng = random.Random(seed)
+    return [{'viewkey': f"{prefix}{seed}{i:05d}", 'title': video_title(rng), 'duration': video_duration(rng)}
+            for i in range(count)]
+
+def _filler(rng, blocks):
+    """Navigation, sidebars and inline script of the kind real listing pages carry."""
+    parts = ['<nav class="menu"><ul>']
+    parts += [f'<li class="menu-item"><a href="/categories/{rng.choice(WORDS)}-{i}">{video_title(rng)}</a></li>'
+              for i in range(blocks * 20)]
+    parts.append('</ul></nav>')
+    parts += [f'<script type="text/javascript">var cfg{i} = {json.dumps({"k": video_title(rng), "n": i})};</script>'
+              for i in range(blocks * 4)]
+    parts += [f'<div class="ad-slot" id="ad{i}"><span class="label">Advertisement</span></div>' for i in range(blocks)]
+    return '\n'.join(parts)
+
+def render_pornhub_page(videos, base='', layout='model', filler=10, seed=0):
+    """A pornhub /model/<id>/videos or /pornstar/<id>/videos/upload page.
+
+    The model layout uses ul#videoCategory; the pornstar layout uses a
+    ul.videoUList with another id, which the scraper reaches through its
+    fallback selector.
+    """
+    rng = random.Random(seed)
+    if layout == 'model':
+        container = '<ul id="videoCategory" class="videos full-row-thumbs">'
+    else:
+        container = '<ul id="mostRecentVideosSection" class="videos row-5-thumbs videoUList">'
+    items = []
+    for v in videos:
+        href = f"{base}/view_video.php?viewkey={v['viewkey']}"
+        items.append(
+            f'<li class="pcVideoListItem js-pop videoblock videoBox" data-video-vkey="{v["viewkey"]}">'
+            f'<div class="wrap"><div class="phimage"><a href="{href}" title="{v["title"]}">'
+            f'<img src="https://ei.example/thumb/{v["viewkey"]}.jpg" alt="{v["title"]}">'
+            f'<div class="marker-overlays"><var class="duration">{v["duration"]}</var></div></a></div>'
+            f'<div class="thumbnail-info-wrapper"><span class="title"><a href="{href}" title="{v["title"]}">'
+            f'{v["title"]}</a></span><div class="videoDetailsBlock"><span class="views"><var>'
+            f'{rng.randint(1, 999)}K</var> views</span><div class="rating-container"><div class="value">'
+            f'{rng.randint(60, 99)}%</div></div></div></div></div></li>')
+    return (f'<!DOCTYPE html><html><head><title>Videos</title></head><body>{_filler(rng, filler)}'
+            f'<div class="container">{container}{"".join(items)}</ul></div>{_filler(rng, filler // 2)}</body></html>')
+
+def render_xhamster_page(videos, base='', layout='creator', filler=10, seed=0):
+    """An xHamster /creators/<id>/newest or /pornstars/<id>/exclusive page."""
+    rng = random.Random(seed)
+    grid_class = 'thumb-list thumb-list--sidebar' if layout == 'creator' else 'thumb-list thumb-list--pornstar'
+    items = []
+    for v in videos:
+        slug = v['title'].lower().replace(' ', '-')
+        href = f"{base}/videos/{slug}-{v['viewkey']}"
+        items.append(
+            f'<div class="thumb-list__item video-thumb" data-video-id="{v["viewkey"]}">'
+            f'<a class="video-thumb__image-container role-pop thumb-image-container" href="{href}">'
+            f'<img class="thumb-image-container__image" src="https://thumb.example/{v["viewkey"]}.jpg" alt="">'
+            f'<div class="thumb-image-container__duration"><div class="tiny-8643e">{v["duration"]}</div></div></a>'
+            f'<div class="video-thumb-info"><a class="video-thumb-info__name role-pop" href="{href}" '
+            f'title="{v["title"]}">{v["title"]}</a><div class="video-thumb-views">{rng.randint(1, 999)}K views</div>'
+            f'</div></div>')
+    return (f'<!DOCTYPE html><html><head><title>Newest</title></head><body>{_filler(rng, filler)}'
+            f'<div class="{grid_class}">{"".join(items)}</div>{_filler(rng, filler // 2)}</body></html>')
+
+def render_x_timeline(videos, username, seed=0, photo_ratio=0.3):
+    """A UserMedia GraphQL response: tweet entries, some with photos instead of video."""
+    rng = random.Random(seed)
+    now = datetime(2026, 1, 1)
+    entries = []
+    for i, v in enumerate(videos):
+        created = now - timedelta(hours=i * 7)
+        media_type = 'photo' if rng.random() < photo_ratio else 'video'
+        media = {'id_str': f"{v['viewkey']}1", 'type': media_type, 'media_url_https': 'https://pbs.example/m.jpg'}
+        if media_type == 'video':
+            minutes, seconds = v['duration'].split(':')
+            media['video_info'] = {'duration_millis': (int(minutes) * 60 + int(seconds)) * 1000,
+                                   'variants': [{'bitrate': 2176000, 'content_type': 'video/mp4',
+                                                 'url': f"https://video.example/{v['viewkey']}.mp4"}]}
+        tweet = {
+            '__typename': 'Tweet',
+            'rest_id': v['viewkey'],
+            'core': {'user_results': {'result': {'__typename': 'User', 'legacy': {'screen_name': username}}}},
+            'legacy': {
+                'id_str': v['viewkey'],
+                'created_at': created.strftime('%a %b %d %H:%M:%S +0000 %Y'),
+                'full_text': f"{v['title']} https://t.co/{v['viewkey'][:10]}",
+                'extended_entities': {'media': [media]},
+            },
+        }
+        if rng.random() < 0.1:
+            tweet = {'__typename': 'TweetWithVisibilityResults', 'tweet': tweet}
+        entries.append({'entryId': f"tweet-{v['viewkey']}", 'sortIndex': str(10 ** 18 - i),
+                        'content': {'entryType': 'TimelineTimelineItem', 'itemContent': {
+                            'itemType': 'TimelineTweet', 'tweet_results': {'result': tweet}}}})
+    return {'data': {'user': {'result': {'__typename': 'User', 'timeline_v2': {'timeline': {'instructions': [
+        {'type': 'TimelineClearCache'},
+        {'type': 'TimelineAddEntries', 'entries': entries},
+    ]}}}}}}
@@ -0,0 +1,135 @@
+"""End-to-end scan load test against scripts/fake_site.py.
+
+Creates (or reuses) a throwaway SQLite database with --performers fake
+pornhub/xHamster performers, then runs scan_performer_service for all of them
+on --concurrency threads, for --rounds rounds (the first is a deep scan,
+later ones use the normal shallow/deep choice). Reports scans/minute and DB
+write throughput (INSERT/UPDATE/DELETE statements and the time spent in them).
+
+Start the fake site first, then:
+    uv run python scripts/fake_site.py --port 8800 --videos 2000 --uploads-per-hour 60 &
+    uv run python scripts/load_test.py --performers 200 --concurrency 8 --rounds 2
+
+Stash and local-file checks are switched off so only scraping and the DB path are measured.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--site-url', default='http://127.0.0.1:8800')
+    parser.add_argument('--performers', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=1)
+    parser.add_argument('--db', help='SQLite file to use (default: a new temporary file)')
+    return parser.parse_args()
+
+args = parse_args()
+
+# Must be set before the app modules read them at import time
+os.environ['PORNHUB_BASE_URL'] = args.site_url
+os.environ['XHAMSTER_BASE_URL'] = args.site_url
+db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='siphon-load-'), 'load.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(db_path)}'
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from app import create_app, db
+from app.models import Performer, Settings, Video
+from app.scraper import SCAN_MODE_DEEP
+from app.services import scan_performer_service
+
+class WriteStats:
+    """Counts write statements and the time spent executing them."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.statements = 0
+        self.seconds = 0.0
+
+    def before(self, conn, cursor, statement, parameters, context, executemany):
+        self.local.started = time.perf_counter()
+
+    def after(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip()[:6].upper() in ('INSERT', 'UPDATE', 'DELETE'):
+            elapsed = time.perf_counter() - self.local.started
+            with self.lock:
+                self.statements += 1
+                self.seconds += elapsed
+
+def seed(app):
+    with app.app_context():
+        db.create_all()
+        for key in ('stash_check_existing', 'local_check_existing'):
+            setting = Settings.query.filter_by(key=key).first() or Settings(key=key)
+            setting.value = 'false'
+            db.session.add(setting)
+        existing = {p.id for p in Performer.query.all()}
+        for i in range(args.performers):
+            performer_id = f'load{i:05d}'
+            if performer_id in existing:
+                continue
+            if i % 2:
+                db.session.add(Performer(id=performer_id, name=f'Load {i}', site='pornhub', type='model' if i % 4 == 1 else 'pornstar'))
+            else:
+                db.session.add(Performer(id=performer_id, name=f'Load {i}', site='xhamster', type='creator' if i % 4 == 0 else 'pornstar'))
+        db.session.commit()
+        return [p.id for p in Performer.query.filter(Performer.id.like('load%')).all()]
+
+def scan_one(app, performer_id, mode):
+    with app.app_context():
+        performer = db.session.get(Performer, performer_id)
+        try:
+            result = scan_performer_service(performer, mode=mode)
+            return result.get('total_found', 0), None
+        except Exception as e:
+            db.session.rollback()
+            return 0, e
+
+def main():
+    app = create_app(with_scheduler=False)
+    performer_ids = seed(app)
+    stats = WriteStats()
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', stats.before)
+        event.listen(db.engine, 'after_cursor_execute', stats.after)
+
+    print(f"Database: {db_path}")
+    print(f"{len(performer_ids)} performers, concurrency {args.concurrency}, site {args.site_url}")
+    for round_number in range(1, args.rounds + 1):
+        mode = SCAN_MODE_DEEP if round_number == 1 else None
+        with app.app_context():
+            videos_before = Video.query.count()
+        statements_before, write_seconds_before = stats.statements, stats.seconds
+
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(lambda pid: scan_one(app, pid, mode), performer_ids))
+        elapsed = time.time() - started
+
+        with app.app_context():
+            videos_after = Video.query.count()
+        failures = [e for _, e in results if e]
+        statements = stats.statements - statements_before
+        write_seconds = stats.seconds - write_seconds_before
+        listed = sum(found for found, _ in results)
+
+        print(f"\nRound {round_number} ({mode or 'auto'}): {elapsed:.1f}s")
+        print(f"  scans/minute:      {len(results) / elapsed * 60:.1f} ({len(failures)} failed)")
+        print(f"  videos listed:     {listed} ({listed / elapsed:.0f}/s)")
+        print(f"  videos inserted:   {videos_after - videos_before} ({(videos_after - videos_before) / elapsed:.0f}/s)")
+        print(f"  write statements:  {statements} ({statements / elapsed:.0f}/s, "
+              f"avg {1000 * write_seconds / statements if statements else 0:.2f} ms, "
+              f"{100 * write_seconds / (elapsed * args.concurrency):.0f}% of scan thread time)")
+        for e in failures[:5]:
+            print(f"  error: {e!r}")
+
+if __name__ == '__main__':
+    main()
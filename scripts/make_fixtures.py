@@ -0,0 +1,37 @@
+"""Writes the offline fixture corpus to scripts/fixtures/.
+
+The pages are synthetic (see listing_pages.py), not captures of the live
+sites: they reproduce the structure the extractors depend on so parsing
+speed and correctness can be measured without network access. If a site's
+layout changes, update listing_pages.py to match and re-run this script.
+
+Usage:
+    uv run python scripts/make_fixtures.py
+"""
+import json
+import os
+
+from listing_pages import make_videos, render_pornhub_page, render_xhamster_page, render_x_timeline
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+ITEMS_PER_PAGE = 40 # Roughly what each site shows per listing page
+
+FIXTURES = {
+    'pornhub_model.html': lambda: render_pornhub_page(make_videos(1, ITEMS_PER_PAGE, 'ph'), layout='model', seed=1),
+    'pornhub_pornstar.html': lambda: render_pornhub_page(make_videos(2, ITEMS_PER_PAGE, 'ph'), layout='pornstar', seed=2),
+    'xhamster_creator.html': lambda: render_xhamster_page(make_videos(3, ITEMS_PER_PAGE, 'xh'), layout='creator', seed=3),
+    'xhamster_pornstar.html': lambda: render_xhamster_page(make_videos(4, ITEMS_PER_PAGE, 'xh'), layout='pornstar', seed=4),
+    'x_user_media.json': lambda: json.dumps(render_x_timeline(make_videos(5, 20, '18'), 'fixture_user', seed=5), indent=1),
+}
+
+def main():
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    for name, render in FIXTURES.items():
+        path = os.path.join(FIXTURE_DIR, name)
+        content = render()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        print(f"{path}: {len(content) / 1024:.0f} KB")
+
+if __name__ == '__main__':
+    main()